@@ -1,14 +1,22 @@
 
 import streamlit as st
 import os
-from audio_utils import AudioProcessor, save_audio_bytes
-from spotify_client import SpotifyClient
+import queue
+from audio_utils import AudioProcessor, AnalysisCache, AdaptiveAsrPolicy, load_calibration
+from scheduler import InferenceScheduler, SchedulerBusy
+from worker_pool import ProcessPoolProcessor
+from live_emotion import LiveEmotionTracker
+from spotify_client import SpotifyClient, GENRE_OPTIONS
+from metrics import METRICS, configure_logging, start_metrics_server
 from audio_recorder_streamlit import audio_recorder
 from datetime import datetime
 import streamlit.components.v1 as components
 
 st.set_page_config(page_title="感情に合わせて音楽を - Music Emotion Player", layout="wide", page_icon="🎵")
 
+# Structured events (log_event) go to stderr; set MOODVIBES_LOG_LEVEL=DEBUG or WARNING to change verbosity
+configure_logging()
+
 # --- Sidebar ---
 with st.sidebar:
     st.title("Music Emotion Player")
@@ -44,15 +52,88 @@ st.write("マイクに向かって話しかけてください。あなたの声
 # --- Initialize Models (Cached) ---
 @st.cache_resource
 def load_audio_processor():
-    return AudioProcessor()
+    processor_kwargs = dict(
+        # Long recordings are scored in 8s windows to keep memory bounded
+        emotion_window=8.0,
+        # Skip silence and noise before the models
+        vad=True,
+        # HuBERT temperature fitted by calibrate_emotion.py (1.0 if not calibrated yet)
+        emotion_temperature=load_calibration(os.getenv("MOODVIBES_CALIBRATION_PATH", "calibration.json")),
+        # eager (fp32), int8 (dynamic quantization) or onnx (ONNX Runtime)
+        backend=os.getenv("MOODVIBES_BACKEND", "eager"),
+        # translate (MarianMT + English classifier) or direct (multilingual classifier)
+        text_engine=os.getenv("MOODVIBES_TEXT_ENGINE", "translate")
+    )
+    # Per-request Whisper latency budget (seconds): under load, faster ASR tiers are used to stay within it
+    asr_budget = os.getenv("MOODVIBES_ASR_BUDGET")
+    if asr_budget:
+        processor_kwargs["asr_policy"] = AdaptiveAsrPolicy(latency_budget=float(asr_budget))
+    cache = AnalysisCache(path=os.getenv("MOODVIBES_CACHE_PATH"))
+
+    # Optional multi-process mode: N worker processes, each pinned to a slice of cores
+    num_workers = int(os.getenv("MOODVIBES_WORKERS", "0"))
+    if num_workers > 1:
+        return ProcessPoolProcessor(num_workers=num_workers, processor_kwargs=processor_kwargs, cache=cache)
+
+    # Load all models in parallel without blocking the first render
+    return AudioProcessor(cache=cache, background=True, **processor_kwargs)
+
+@st.cache_resource
+def load_scheduler(_processor):
+    # Every session queues into the same micro-batching scheduler; in pool mode
+    # one batch loop per worker process keeps all of them busy
+    scheduler = InferenceScheduler(_processor, batch_workers=getattr(_processor, "num_workers", 1))
+    if isinstance(_processor, AudioProcessor):
+        # Requests waiting for a batch count as load for the adaptive ASR tiers
+        _processor.queue_depth_source = lambda: scheduler.queue_depth
+    return scheduler
 
 @st.cache_resource
 def load_spotify_client():
-    return SpotifyClient()
+    # Merge tracks from the top playlists so one bad playlist can't empty the results
+    client = SpotifyClient(playlist_fanout=3)
+    if client.auth_success:
+        # Warm every mood x genre combination in the background
+        client.start_prefetch()
+    return client
+
+@st.cache_resource
+def load_metrics_server():
+    # Optional scrape endpoint: /metrics (Prometheus) and /metrics.json
+    port = os.getenv("MOODVIBES_METRICS_PORT")
+    return start_metrics_server(int(port)) if port else None
 
 with st.spinner("AIモデルを読み込み中..."):
     processor = load_audio_processor()
+    scheduler = load_scheduler(processor)
     spotify = load_spotify_client()
+    load_metrics_server()
+
+# Streaming shows text as soon as it's decoded; turn off to favour batched throughput
+streaming_enabled = os.getenv("MOODVIBES_STREAMING", "1") == "1"
+
+# Models keep loading in the background; show which ones are still warming up
+model_status = processor.readiness()
+if not all(model_status.values()):
+    model_labels = {"asr": "音声認識", "emotion": "音声感情", "translator": "翻訳", "text_classifier": "テキスト感情"}
+    # Models that failed to load won't become ready
+    failed = set(processor.load_errors)
+    st.caption("モデル準備状況: " + " / ".join(
+        f"{'✅' if ready else '❌' if name in failed else '⏳'} {model_labels[name]}" for name, ready in model_status.items()
+    ))
+
+# Per-stage latency / memory (p50/p95/p99) recorded in this process
+with st.sidebar:
+    with st.expander("📊 処理時間メトリクス"):
+        stage_metrics = METRICS.snapshot()
+        if stage_metrics:
+            st.table([
+                {"stage": stage, "count": m["count"], **{f"{k} (ms)": round(1000 * v, 1) for k, v in m["seconds"].items()}}
+                for stage, m in sorted(stage_metrics.items())
+            ])
+            st.download_button("JSONをダウンロード", METRICS.export_json(), file_name="moodvibes_metrics.json", mime="application/json")
+        else:
+            st.caption("まだ計測データがありません")
 
 # Use getattr to handle cases where the attribute might be missing (though removing cache should fix it)
 auth_success = getattr(spotify, 'auth_success', False)
@@ -78,7 +159,7 @@ if 'history' not in st.session_state:
     st.session_state.history = []
 
 # --- Audio Input Method ---
-input_mode = st.radio("入力モードを選択", ["🎙️ マイクで録音", "📂 ファイルアップロード"], horizontal=True)
+input_mode = st.radio("入力モードを選択", ["🎙️ マイクで録音", "📂 ファイルアップロード", "🔴 ライブ"], horizontal=True)
 
 processed_audio = False # Flag to track if we processed new audio this run
 
@@ -114,50 +195,106 @@ elif input_mode == "📂 ファイルアップロード":
             else:
                  st.info("この音声は既に解析済みです。")
 
+elif input_mode == "🔴 ライブ":
+    st.subheader("ライブモード")
+    try:
+        from streamlit_webrtc import webrtc_streamer, WebRtcMode
+    except ImportError:
+        st.warning("ライブモードには `streamlit-webrtc` が必要です。")
+        st.stop()
+
+    live_ctx = webrtc_streamer(
+        key="live-mood",
+        mode=WebRtcMode.SENDONLY,
+        audio_receiver_size=256,
+        media_stream_constraints={"audio": True, "video": False}
+    )
+
+    if live_ctx.audio_receiver:
+        if not processor.wait_ready(["emotion"], timeout=0):
+            with st.spinner("AIモデルを準備中..."):
+                if not processor.wait_ready(["emotion"]):
+                    st.error("音声感情モデルを読み込めなかったため、ライブモードは利用できません。")
+                    st.stop()
+
+        if 'live_tracker' not in st.session_state:
+            st.session_state.live_tracker = LiveEmotionTracker(
+                lambda y: processor.predict_emotion(y, return_probs=True)
+            )
+        tracker = st.session_state.live_tracker
+
+        live_mood = st.empty()
+        live_tracks = st.empty()
+        live_labels = {'neu': '😐 ニュートラル', 'hap': '😄 ハッピー', 'sad': '😢 サッド', 'ang': '😠 アングリー'}
+
+        # Runs while the microphone is streaming; each rerun resumes from the session's tracker
+        while live_ctx.state.playing:
+            try:
+                frames = live_ctx.audio_receiver.get_frames(timeout=1)
+            except queue.Empty:
+                continue
+            for frame in frames:
+                channels = len(frame.layout.channels)
+                samples = frame.to_ndarray().reshape(-1, channels).mean(axis=1) / 32768.0
+                tracker.push(samples, frame.sample_rate)
+
+            if tracker.update():
+                # Smoothed mood changed: switch the recommendation (served from the prefetched cache)
+                live_mood.subheader(f"現在の気分: {live_labels.get(tracker.label, tracker.label)}")
+                tracks = spotify.get_recommendations(tracker.label)
+                if isinstance(tracks, list):
+                    with live_tracks.container():
+                        for track in [t for t in tracks if t.get('id')][:3]:
+                            components.iframe(f"https://open.spotify.com/embed/track/{track['id']}", height=80)
+
 # --- Processing Logic ---
 if processed_audio:
+    if not processor.is_ready("asr") or not processor.is_ready("emotion"):
+        with st.spinner("AIモデルを準備中..."):
+            processor.wait_ready(["asr", "emotion"])
+
     with st.spinner("音声を解析中..."):
-        # Determine file extension
-        # Default to .wav for recording or if unknown
-        file_ext = ".wav"
-        if 'uploaded_file' in locals() and uploaded_file is not None:
-             # Extract extension including dot, e.g. .mp3
-            _, ext = os.path.splitext(uploaded_file.name)
-            if ext:
-                file_ext = ext
-        
-        temp_file = f"temp_input{file_ext}"
-        save_audio_bytes(audio_bytes_to_process, temp_file)
-        
-        # 1. Transcribe
-        transcription = processor.transcribe(temp_file)
+        result = None
+        live_transcript = st.empty()
+        try:
+            if streaming_enabled and hasattr(processor, "analyze_stream"):
+                # Show the transcript segment by segment while the rest of the pipeline runs.
+                # Streams wait for an execution slot in the shared scheduler like batched requests
+                segments = []
+                for event, payload in scheduler.stream(audio_bytes_to_process):
+                    if event == "segment":
+                        segments.append(payload["text"])
+                        live_transcript.info("**認識中のテキスト:**\n\n" + " ".join(segments))
+                    else:
+                        result = payload
+            else:
+                # Queued into the micro-batching scheduler shared by all sessions;
+                # repeated clips are served straight from the content-addressed cache
+                result = scheduler.submit(audio_bytes_to_process).result()
+        except SchedulerBusy:
+            st.warning("現在混雑しています。しばらくしてからもう一度お試しください。")
+        except RuntimeError as e:
+            # A model failed to load for good (or its worker died): degrade to picking the mood by hand
+            st.error("音声解析モデルを利用できないため、感情を自動で判定できませんでした。下のメニューから気分を選択してください。")
+            st.caption(f"詳細: {e}")
+            result = {"transcription": "（音声解析を利用できません）", "emotion": "neu", "audio_emotion": None, "text_emotion": None}
+        finally:
+            live_transcript.empty()
+
+    if result is not None:
+        transcription = result["transcription"]
         st.session_state.transcription = transcription if transcription else "（音声が検出されませんでした）"
-        
-        # 2. Emotion Analysis
-        emotion_label = processor.predict_emotion(temp_file)
-        # 3. Text Emotion Analysis
-        text_emotion_label = processor.predict_text_emotion(transcription)
-        
-        # Combine logic: 
-        # If Audio is Neutral but Text is Strong (Hap/Sad/Ang), use Text.
-        # Otherwise respect Audio (tone often conveys more truth than text sarcasm, but for simple app, text content matters).
-        final_emotion = emotion_label
-        if emotion_label == 'neu' and text_emotion_label != 'neu':
-            final_emotion = text_emotion_label
             
-        st.session_state.emotion = final_emotion
-        st.session_state.audio_emotion = emotion_label
-        st.session_state.text_emotion = text_emotion_label
+        st.session_state.emotion = result["emotion"]
+        st.session_state.audio_emotion = result["audio_emotion"]
+        st.session_state.text_emotion = result["text_emotion"]
+        st.session_state.asr_tier = result.get("asr_tier")
         
         # Increment analysis count to reset the selectbox state
         st.session_state.analysis_count += 1
         
         # Save processed bytes to prevent re-run
         st.session_state.processed_audio_bytes = audio_bytes_to_process
-        
-        # Cleanup
-        if os.path.exists(temp_file):
-            os.remove(temp_file)
 
 # --- Results Display ---
 if st.session_state.transcription or st.session_state.emotion:
@@ -168,6 +305,8 @@ if st.session_state.transcription or st.session_state.emotion:
     with col1:
         display_text = st.session_state.transcription if st.session_state.transcription else "（音声が検出されませんでした）"
         st.info(f"**認識されたテキスト:**\n\n{display_text}")
+        if st.session_state.get("asr_tier"):
+            st.caption(f"音声認識モード: {st.session_state.asr_tier}")
     
     with col2:
         # Translate emotion to Japanese and add visuals
@@ -196,7 +335,7 @@ if st.session_state.transcription or st.session_state.emotion:
         st.markdown(f"""
         <div style="padding:10px; border-radius:10px; background-color:rgba(128,128,128,0.1); border-left: 5px solid {final_info.get('color', 'gray')};">
             <h4>総合判定: {final_info['emoji']} {final_info['label']}</h4>
-            <small>音声分析: {emotion_map.get(audio_em, {}).get('emoji')} / テキスト分析: {emotion_map.get(text_em, {}).get('emoji')}</small>
+            <small>音声分析: {emotion_map.get(audio_em, {}).get('emoji', '—')} / テキスト分析: {emotion_map.get(text_em, {}).get('emoji', '—')}</small>
         </div>
         """, unsafe_allow_html=True)
         
@@ -220,7 +359,7 @@ if st.session_state.transcription or st.session_state.emotion:
             
         with opt_col2:
             # Genre Selector
-            genre_options = ['All', 'J-Pop', 'K-Pop', 'Pop', 'Rock', 'Jazz', 'Hip-Hop', 'Lo-Fi', 'Classical', 'Electronic']
+            genre_options = GENRE_OPTIONS
             selected_genre = st.selectbox(
                 "ジャンルで絞り込み:",
                 options=genre_options,
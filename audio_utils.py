@@ -1,118 +1,1490 @@
+import io
 import os
-import torch
-import librosa
+import re
+import json
+import time
+import logging
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from faster_whisper import WhisperModel
-from transformers import Wav2Vec2FeatureExtractor, HubertForSequenceClassification, pipeline
-import soundfile as sf
+
+from metrics import METRICS, RSS_WATCH, span, log_event
+
+# torch, librosa, faster_whisper and transformers are imported where they are
+# used, so importing this module stays cheap and models can load in the background
+
+# Both Whisper and HuBERT expect 16 kHz mono input
+SAMPLE_RATE = 16000
+
+# Text classifier labels -> standard labels (neu, hap, sad, ang)
+# Covers both twitter-roberta-base-emotion and the multilingual xlm-emo-t
+TEXT_LABEL_MAP = {
+    'joy': 'hap',
+    'optimism': 'hap',
+    'anger': 'ang',
+    'sadness': 'sad',
+    'fear': 'sad', # Map fear to sad or ang? sad for now
+    'surprise': 'hap', # Map surprise to hap?
+    'neutral': 'neu'   # If model has neutral
+}
+
+# Sentence-final punctuation in Whisper's Japanese (and English) output
+SENTENCE_ENDINGS = ("。", "！", "？", "!", "?", ".")
+
+# Models loaded by AudioProcessor, each with its own readiness flag
+MODEL_KEYS = ("asr", "emotion", "translator", "text_classifier")
 
 # Initialize models globally to avoid reloading (Streamlit caching should be used in app.py really, but for clean separation let's define classes/funcs)
 
 class AudioProcessor:
-    def __init__(self):
+    def __init__(self, asr_threads=None, torch_threads=None, cache=None,
+                 emotion_window=None, emotion_hop=None, emotion_batch_size=8, emotion_aggregation="mean", attention_temperature=1.0,
+                 vad=False, emotion_temperature=1.0, fusion_policy=None, background=False, backend="eager",
+                 text_engine="translate", direct_text_model="MilaNLProc/xlm-emo-t", asr_policy=None):
+        # Thread budgets: split the cores between the ASR branch (CTranslate2)
+        # and the acoustic/text branch (torch) so analyze() doesn't oversubscribe
+        cpu_count = os.cpu_count() or 2
+        self.asr_threads = asr_threads or max(1, cpu_count // 2)
+        self.torch_threads = torch_threads or max(1, cpu_count - self.asr_threads)
+
         # ASR Model
-        print("Loading Whisper model...")
-        self.asr_model = WhisperModel("small", device="cpu", compute_type="int8") # Use base/cpu for speed
+        # With an AdaptiveAsrPolicy each request gets a Whisper tier (size, beam,
+        # language) that fits its latency budget; without one, DEFAULT_ASR_TIER is always used
+        self.asr_policy = asr_policy
+        self.asr_model_size = asr_policy.primary.model_size if asr_policy else DEFAULT_ASR_TIER.model_size
+        self.asr_model = None
+        self.asr_models = {} # model size -> WhisperModel, resident once loaded
+        # Requests currently in Whisper, plus an optional callable for requests queued
+        # upstream (e.g. InferenceScheduler.queue_depth); both count as load for the policy
+        self.asr_in_flight = 0
+        self.queue_depth_source = None
+        self._asr_lock = threading.Lock()
+        # Load-adjusted clock for the policy: advances at 1 / (Whisper calls running),
+        # so a request's share of it is the time it would have taken alone
+        self._asr_active = 0
+        self._asr_clock = 0.0
+        self._asr_clock_at = 0.0
         
         # Emotion Model
-        print("Loading Hubert model...")
         self.emotion_model_name = "superb/hubert-base-superb-er"
-        self.feature_extractor = Wav2Vec2FeatureExtractor.from_pretrained(self.emotion_model_name)
-        self.emotion_model = HubertForSequenceClassification.from_pretrained(self.emotion_model_name)
-        
-        # Emotion Labels (from hubert-base-superb-er config)
-        # usually: neu, hap, ang, sad
-        self.id2label = self.emotion_model.config.id2label
+        self.feature_extractor = None
+        self.emotion_model = None
+        # Emotion Labels (from hubert-base-superb-er config), set once loaded
+        self.id2label = None
+
+        # Temperature for calibrating HuBERT probabilities; 1.0 = raw softmax.
+        # Fit it on labelled held-out clips with calibrate_emotion.py (see fit_temperature())
+        self.emotion_temperature = emotion_temperature
+
+        # Sliding-window mode (seconds): clips longer than the window are split
+        # into overlapping windows and batched, which bounds peak memory
+        self.emotion_window = emotion_window
+        self.emotion_hop = emotion_hop or (emotion_window / 2 if emotion_window else None)
+        self.emotion_batch_size = emotion_batch_size
+        self.emotion_aggregation = emotion_aggregation
+        # "attention" weights windows by softmax(logit margin / attention_temperature);
+        # lower values trust the most confident windows more (see pool_window_logits())
+        self.attention_temperature = attention_temperature
         
-        # Text Translation & Emotion Models (Lazy Init)
+        # Inference engine for HuBERT and the text models (Whisper is already int8 CTranslate2)
+        self.backend = get_backend(backend)
+
+        # Text Translation & Emotion Models
+        # text_engine="translate": MarianMT ja->en, then an English classifier
+        # text_engine="direct": one multilingual classifier on the Japanese text (no translation hop)
+        if text_engine not in ("translate", "direct"):
+            raise ValueError(f"Unknown text engine '{text_engine}'. Choose 'translate' or 'direct'.")
+        self.text_engine = text_engine
+        self.translation_model_name = "Helsinki-NLP/opus-mt-ja-en" if text_engine == "translate" else None
+        self.text_emotion_model_name = "cardiffnlp/twitter-roberta-base-emotion" if text_engine == "translate" else direct_text_model
         self.translator = None
         self.text_emotion_classifier = None
 
-    def transcribe(self, audio_path):
+        # Per-sentence memoization of ja -> en translations and classifier scores
+        self.translation_cache = AnalysisCache(max_entries=4096, max_bytes=4 * 1024 * 1024)
+        self.text_emotion_cache = AnalysisCache(max_entries=4096, max_bytes=4 * 1024 * 1024)
+
+        # Energy + spectral-flatness voice activity trimming before inference (analyze() only)
+        self.vad = vad
+
+        # Decides how audio and text emotion combine, and when the text branch can be skipped
+        self.fusion_policy = fusion_policy or FusionPolicy()
+
+        # Result cache shared by every caller of this processor (optional)
+        self.cache = cache
+        self.model_versions = "|".join([
+            repr(self.asr_policy) if self.asr_policy else f"whisper-{self.asr_model_size}-int8",
+            f"{self.emotion_model_name}-window{self.emotion_window}-{self.emotion_aggregation}"
+            f"{self.attention_temperature if self.emotion_aggregation == 'attention' else ''}",
+            f"text-{self.text_engine}",
+            str(self.translation_model_name),
+            self.text_emotion_model_name,
+            f"backend-{self.backend.name}",
+            f"vad-{self.vad}",
+            f"temperature-{self.emotion_temperature}",
+            repr(self.fusion_policy)
+        ])
+
+        # One worker per branch of analyze(): acoustic, and ASR -> translate -> classify
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="analyze")
+
+        # All four models load in parallel; with background=True the constructor
+        # returns immediately and callers check is_ready() / wait_ready()
+        self._loaded = {name: threading.Event() for name in MODEL_KEYS}
+        self.load_errors = {}
+        self.load_seconds = {}
+        if background:
+            threading.Thread(target=self.load_models, name="model-loader", daemon=True).start()
+        else:
+            self.load_models()
+
+    def load_models(self):
+        """
+        Loads and warms up every model in parallel. Blocks until all are done.
+        Every model ends up either loaded or in load_errors, so waiters never hang.
+        """
+        loaders = {
+            "asr": self._load_asr,
+            "emotion": self._load_emotion,
+            "translator": self._load_translator,
+            "text_classifier": self._load_text_classifier
+        }
+        try:
+            import torch
+            torch.set_num_threads(self.torch_threads)
+        except Exception as e:
+            # Without torch none of the models can load; record that for each of them
+            for name in loaders:
+                log_event("model.load_failed", level=logging.ERROR, model=name, error=f"{type(e).__name__}: {e}")
+                self.load_errors[name] = str(e)
+                self._loaded[name].set()
+            return
+
+        with ThreadPoolExecutor(max_workers=len(loaders), thread_name_prefix="load") as pool:
+            for name, loader in loaders.items():
+                pool.submit(self._load_model, name, loader)
+
+    def _load_model(self, name, loader):
+        start = time.perf_counter()
+        try:
+            loader()
+        except Exception as e:
+            log_event("model.load_failed", level=logging.ERROR, model=name, error=f"{type(e).__name__}: {e}")
+            self.load_errors[name] = str(e)
+        finally:
+            self.load_seconds[name] = time.perf_counter() - start
+            self._loaded[name].set()
+
+    def _load_asr(self):
+        self.asr_model = self._load_whisper(self.asr_model_size)
+
+        if self.asr_policy:
+            # The faster tiers' models load after ASR is marked ready; until then
+            # the policy only picks among the sizes already resident
+            extra_sizes = [size for size in self.asr_policy.model_sizes() if size != self.asr_model_size]
+            threading.Thread(target=self._load_extra_whisper, args=(extra_sizes,), name="asr-tiers", daemon=True).start()
+
+    def _load_whisper(self, size):
+        from faster_whisper import WhisperModel
+
+        print(f"Loading Whisper model ({size})...")
+        model = WhisperModel(size, device="cpu", compute_type="int8", cpu_threads=self.asr_threads) # Use base/cpu for speed
+
+        # Warm-up: one short synthetic pass so the first request doesn't pay for it
+        segments, _ = model.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), beam_size=1)
+        list(segments)
+
+        with self._asr_lock:
+            self.asr_models[size] = model
+        return model
+
+    def _load_extra_whisper(self, sizes):
+        for size in sizes:
+            try:
+                self._load_whisper(size)
+            except Exception as e:
+                log_event("model.load_failed", level=logging.WARNING, model=f"whisper-{size}", error=f"{type(e).__name__}: {e}")
+
+    def _load_emotion(self):
+        import torch
+
+        print(f"Loading Hubert model ({self.backend.name})...")
+        feature_extractor, emotion_model = self.backend.load_audio_classifier(self.emotion_model_name)
+
+        inputs = feature_extractor(np.zeros(SAMPLE_RATE, dtype=np.float32), sampling_rate=SAMPLE_RATE, return_tensors="pt")
+        with torch.no_grad():
+            emotion_model(**inputs)
+
+        self.feature_extractor = feature_extractor
+        self.emotion_model = emotion_model
+        # usually: neu, hap, ang, sad
+        self.id2label = emotion_model.config.id2label
+
+    def _load_translator(self):
+        if self.translation_model_name is None:
+            # Direct engine: nothing to load
+            return
+
+        print(f"Loading Text Translation model ({self.backend.name})...")
+        translator = self.backend.load_pipeline("translation", self.translation_model_name)
+        translator("こんにちは")
+        self.translator = translator
+
+    def _load_text_classifier(self):
+        print(f"Loading Text Emotion model ({self.backend.name})...")
+        classifier = self.backend.load_pipeline("text-classification", self.text_emotion_model_name, top_k=1)
+        classifier("こんにちは" if self.text_engine == "direct" else "hello")
+        self.text_emotion_classifier = classifier
+
+    def is_ready(self, name):
+        """
+        True once the model has loaded and warmed up successfully.
+        """
+        return self._loaded[name].is_set() and name not in self.load_errors
+
+    def readiness(self):
+        return {name: self.is_ready(name) for name in MODEL_KEYS}
+
+    def wait_ready(self, names=MODEL_KEYS, timeout=None):
+        """
+        Waits until the given models have finished loading.
+        Returns True if all of them are ready.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for name in names:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self._loaded[name].wait(remaining):
+                return False
+        return all(self.is_ready(name) for name in names)
+
+    def _require(self, name):
+        self._loaded[name].wait()
+        if name in self.load_errors:
+            raise RuntimeError(f"{name} model failed to load: {self.load_errors[name]}")
+
+    def analyze(self, audio, latency_budget=None):
+        """
+        Runs the full pipeline on one clip and returns a combined result:
+            { transcription, audio_emotion, audio_probs, text_emotion, emotion }
+        HuBERT doesn't depend on the transcript, so it runs concurrently with Whisper.
+        The text branch (translate -> classify) only runs when the fusion policy
+        says it can change the outcome; otherwise text_emotion is None.
+        With `vad` enabled, non-speech is trimmed first (stats under "vad") and
+        a clip without speech returns 'neu' without running any model.
+        With an adaptive ASR policy, the Whisper tier chosen for `latency_budget`
+        is reported under "asr_tier".
+        """
+        cache_key = None
+        if self.cache is not None and not isinstance(audio, str):
+            # Hash the raw content so a repeated clip skips decoding as well
+            cache_key = audio_cache_key(audio, self.model_versions)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        if not isinstance(audio, np.ndarray):
+            audio = self.load_audio(audio)
+
+        vad_stats = None
+        if self.vad:
+            audio, vad_stats = trim_silence(audio)
+            if not vad_stats.speech_detected:
+                return self._store_result(cache_key, self._silent_result(vad_stats))
+
+        asr_tier = self.select_asr_tier(audio, latency_budget)
+        audio_future = self.executor.submit(self.predict_emotion, audio, return_probs=True)
+        transcription_future = self.executor.submit(self.transcribe, audio, tier=asr_tier)
+
+        audio_probs = audio_future.result()
+        transcription = transcription_future.result()
+
+        # Translation + text classification only run if they can change the outcome.
+        # Until the text models are ready, the result is audio-only (degraded).
+        text_emotion_label = None
+        degraded = False
+        if self.fusion_policy.needs_text(audio_probs):
+            if self.text_models_ready():
+                text_emotion_label = self.predict_text_emotion(transcription)
+            else:
+                degraded = True
+
+        result = self._build_result(transcription, audio_probs, text_emotion_label, vad_stats, degraded, asr_tier)
+        return self._store_result(cache_key, result)
+
+    def analyze_stream(self, audio, latency_budget=None):
+        """
+        Streaming version of analyze(). Yields events as they become available:
+            ("segment", { start, end, text })   for each transcribed segment
+            ("result", result)                  once, at the end (same dict as analyze())
+        HuBERT runs in the background while Whisper streams. Once it's known that
+        the text branch is needed, finished sentences are translated early into
+        the translation cache, so only the last sentence is left when the transcript is complete.
+        """
+        cache_key = None
+        if self.cache is not None and not isinstance(audio, str):
+            cache_key = audio_cache_key(audio, self.model_versions)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                yield "result", cached
+                return
+
+        if not isinstance(audio, np.ndarray):
+            audio = self.load_audio(audio)
+
+        vad_stats = None
+        if self.vad:
+            audio, vad_stats = trim_silence(audio)
+            if not vad_stats.speech_detected:
+                yield "result", self._store_result(cache_key, self._silent_result(vad_stats))
+                return
+
+        asr_tier = self.select_asr_tier(audio, latency_budget)
+        audio_future = self.executor.submit(self.predict_emotion, audio, return_probs=True)
+
+        texts = []
+        sentence_start = 0 # index into texts of the first segment not yet sent for translation
+        translations = [] # futures warming the translation cache with finished sentences
+        for segment in self.transcribe_stream(audio, tier=asr_tier):
+            texts.append(segment["text"])
+            yield "segment", segment
+
+            if (self.text_engine == "translate" and segment["text"].rstrip().endswith(SENTENCE_ENDINGS) and audio_future.done()
+                    and self.fusion_policy.needs_text(audio_future.result()) and self.text_models_ready()):
+                finished = split_sentences(" ".join(texts[sentence_start:]))
+                translations.append(self.executor.submit(self.translate_sentences, finished))
+                sentence_start = len(texts)
+
+        transcription = " ".join(texts)
+        audio_probs = audio_future.result()
+
+        text_emotion_label = None
+        degraded = False
+        if self.fusion_policy.needs_text(audio_probs):
+            if self.text_models_ready():
+                # Earlier sentences are already in the translation cache; only the tail is new
+                for future in translations:
+                    future.result()
+                text_emotion_label = self.predict_text_emotion(transcription)
+            else:
+                degraded = True
+
+        result = self._build_result(transcription, audio_probs, text_emotion_label, vad_stats, degraded, asr_tier)
+        yield "result", self._store_result(cache_key, result)
+
+    def analyze_batch(self, audios, stage_seconds=None):
+        """
+        Batched version of analyze() for several clips at once.
+        Whisper transcribes the clips one after another on the worker pool while
+        HuBERT scores all of them in batched forward passes; translation and
+        classification are batched over the clips that need them.
+        If `stage_seconds` is given, time per stage is added to it.
+        Returns one result per input, in input order.
+        """
+        if stage_seconds is None:
+            stage_seconds = {}
+
+        def add_time(stage, seconds):
+            stage_seconds[stage] = stage_seconds.get(stage, 0.0) + seconds
+
+        batch_start = time.perf_counter()
+        results = [None] * len(audios)
+        cache_keys = [None] * len(audios)
+        pending = [] # [index, waveform, vad_stats]
+
+        start = time.perf_counter()
+        for i, audio in enumerate(audios):
+            if self.cache is not None and not isinstance(audio, str):
+                cache_keys[i] = audio_cache_key(audio, self.model_versions)
+                results[i] = self.cache.get(cache_keys[i])
+                if results[i] is not None:
+                    continue
+            if not isinstance(audio, np.ndarray):
+                audio = self.load_audio(audio)
+            pending.append([i, audio, None])
+        add_time("decode", time.perf_counter() - start)
+
+        if self.vad:
+            start = time.perf_counter()
+            for item in pending:
+                item[1], item[2] = trim_silence(item[1])
+            add_time("vad", time.perf_counter() - start)
+
+        speech = []
+        for item in pending:
+            if item[2] is not None and not item[2].speech_detected:
+                results[item[0]] = self._store_result(cache_keys[item[0]], self._silent_result(item[2]))
+            else:
+                speech.append(item)
+        if not speech:
+            return results
+
+        asr_tiers = [None] * len(speech)
+
+        def transcribe_all():
+            start = time.perf_counter()
+            texts = []
+            for k, (_, waveform, _) in enumerate(speech):
+                # Clips are transcribed one after another, so later clips have less of their budget left
+                remaining = None
+                if self.asr_policy is not None:
+                    remaining = max(0.0, self.asr_policy.latency_budget - (time.perf_counter() - batch_start))
+                asr_tiers[k] = self.select_asr_tier(waveform, remaining)
+                texts.append(self.transcribe(waveform, tier=asr_tiers[k]))
+            return texts, time.perf_counter() - start
+
+        transcription_future = self.executor.submit(transcribe_all)
+
+        start = time.perf_counter()
+        probs = self.predict_emotion_batch([waveform for _, waveform, _ in speech], return_probs=True)
+        add_time("audio_emotion", time.perf_counter() - start)
+
+        transcriptions, transcribe_seconds = transcription_future.result()
+        add_time("transcribe", transcribe_seconds)
+
+        text_labels = [None] * len(speech)
+        needs_text = [k for k in range(len(speech)) if self.fusion_policy.needs_text(probs[k])]
+        degraded = bool(needs_text) and not self.text_models_ready()
+        if needs_text and not degraded:
+            start = time.perf_counter()
+            labels = self.predict_text_emotion_batch([transcriptions[k] for k in needs_text])
+            for k, label in zip(needs_text, labels):
+                text_labels[k] = label
+            add_time("text_emotion", time.perf_counter() - start)
+
+        for k, (i, _, vad_stats) in enumerate(speech):
+            result = self._build_result(
+                transcriptions[k], probs[k], text_labels[k], vad_stats, degraded and k in needs_text, asr_tiers[k]
+            )
+            results[i] = self._store_result(cache_keys[i], result)
+
+        return results
+
+    def cached_result(self, audio):
+        """
+        Returns the cached analyze() result for this clip, or None.
+        A miss isn't counted here: analyze() looks the clip up again and counts it.
+        """
+        if self.cache is None or isinstance(audio, str):
+            return None
+        return self.cache.get(audio_cache_key(audio, self.model_versions), count_miss=False)
+
+    def text_models_ready(self):
+        return self.is_ready("translator") and self.is_ready("text_classifier")
+
+    def _build_result(self, transcription, audio_probs, text_emotion_label, vad_stats=None, degraded=False, asr_tier=None):
+        result = {
+            "transcription": transcription,
+            "audio_emotion": max(audio_probs, key=audio_probs.get),
+            "audio_probs": audio_probs,
+            "text_emotion": text_emotion_label,
+            "emotion": self.fusion_policy.fuse(audio_probs, text_emotion_label)
+        }
+        if vad_stats is not None:
+            result["vad"] = vad_stats.to_dict()
+        if degraded:
+            result["degraded"] = True
+        if self.asr_policy is not None and asr_tier is not None:
+            result["asr_tier"] = asr_tier.name
+        return result
+
+    def _silent_result(self, vad_stats):
+        # Same keys as _build_result(), so results have one schema whether or not VAD short-circuited
+        return {
+            "transcription": "",
+            "audio_emotion": 'neu',
+            "audio_probs": None,
+            "text_emotion": None,
+            "emotion": 'neu',
+            "vad": vad_stats.to_dict()
+        }
+
+    def _store_result(self, cache_key, result):
+        # Degraded results (and transcripts from a faster ASR tier) aren't cached
+        # so the clip gets the full analysis next time
+        if cache_key is None or result.get("degraded"):
+            return result
+        if self.asr_policy is not None and not self.asr_policy.is_full_quality(result.get("asr_tier")):
+            return result
+        self.cache.put(cache_key, result)
+        return result
+
+    def load_audio(self, audio):
         """
-        Transcribes audio file to text.
+        Decodes raw audio bytes, a file-like buffer or a file path once into a 16 kHz float32 waveform.
+        The returned array can be passed to both transcribe() and predict_emotion().
         """
-        segments, info = self.asr_model.transcribe(audio_path, beam_size=5)
-        text = " ".join([segment.text for segment in segments])
+        return decode_audio_bytes(audio, sampling_rate=SAMPLE_RATE)
+
+    def transcribe(self, audio, latency_budget=None, tier=None):
+        """
+        Transcribes audio to text.
+        `audio` is either a file path or a 16 kHz float32 waveform from load_audio().
+        With an adaptive ASR policy, `latency_budget` (seconds) overrides the policy's default.
+        """
+        text = " ".join([segment["text"] for segment in self.transcribe_stream(audio, latency_budget, tier)])
         return text
 
-    def predict_emotion(self, audio_path):
+    def select_asr_tier(self, audio, latency_budget=None):
         """
-        Predicts emotion from audio file.
+        The Whisper tier for this clip: DEFAULT_ASR_TIER without an adaptive policy,
+        otherwise the policy's choice for the clip's duration and the current load
+        (requests already in Whisper plus those queued upstream).
         """
-        # Load audio at 16k for Hubert
-        y, sr = librosa.load(audio_path, sr=16000)
+        if self.asr_policy is None:
+            return DEFAULT_ASR_TIER
+        duration = len(audio) / SAMPLE_RATE if isinstance(audio, np.ndarray) else audio_duration(audio)
+        queue_depth = self.asr_in_flight
+        if self.queue_depth_source is not None:
+            queue_depth += self.queue_depth_source()
+        with self._asr_lock:
+            resident = set(self.asr_models)
+        return self.asr_policy.choose(duration, queue_depth, latency_budget, resident)
+
+    def transcribe_stream(self, audio, latency_budget=None, tier=None):
+        """
+        Yields transcribed segments as Whisper produces them:
+            { start, end, text }
+        Whisper decodes lazily, so the first segment arrives long before the whole clip is done.
+        `tier` (from select_asr_tier()) fixes the Whisper configuration; by default it is selected here.
+        """
+        self._require("asr")
+        tier = tier or self.select_asr_tier(audio, latency_budget)
+        with self._asr_lock:
+            model = self.asr_models.get(tier.model_size, self.asr_model)
+            self.asr_in_flight += 1
+
+        # Only time spent inside Whisper counts, not the consumer's work between segments.
+        # The policy learns from `solo` (see _asr_tick()), the cost without other requests
+        # sharing Whisper; estimate() adds the load back from the queue depth
+        rss = RSS_WATCH.start()
+        elapsed = solo = 0.0
+        try:
+            start, clock = time.perf_counter(), self._asr_tick(1)
+            try:
+                segments, info = model.transcribe(audio, beam_size=tier.beam_size, language=tier.language)
+            finally:
+                elapsed, solo = time.perf_counter() - start, self._asr_tick(-1) - clock
+            segments = iter(segments)
+            while True:
+                start, clock = time.perf_counter(), self._asr_tick(1)
+                try:
+                    segment = next(segments, None)
+                finally:
+                    elapsed += time.perf_counter() - start
+                    solo += self._asr_tick(-1) - clock
+                if segment is None:
+                    break
+                yield {"start": segment.start, "end": segment.end, "text": segment.text}
+            if self.asr_policy is not None:
+                self.asr_policy.observe(tier, info.duration, solo)
+        finally:
+            with self._asr_lock:
+                self.asr_in_flight -= 1
+            METRICS.observe("asr.whisper", elapsed, RSS_WATCH.stop(rss))
+            if self.asr_policy is not None:
+                METRICS.observe(f"asr.whisper.{tier.name}", elapsed)
+
+    def _asr_tick(self, delta):
+        """
+        Marks a Whisper call starting (+1) or ending (-1) and returns the load-adjusted
+        clock. Between two ticks it advances by wall time / calls running, so with two
+        requests decoding side by side each is charged half of the elapsed time.
+        """
+        with self._asr_lock:
+            now = time.perf_counter()
+            if self._asr_active:
+                self._asr_clock += (now - self._asr_clock_at) / self._asr_active
+            self._asr_clock_at = now
+            self._asr_active += delta
+            return self._asr_clock
+
+    def predict_emotion(self, audio, return_probs=False):
+        """
+        Predicts emotion from audio.
+        `audio` is either a file path or a 16 kHz float32 waveform from load_audio().
+        Returns the label, or with return_probs=True the calibrated
+        probabilities as { label: probability }.
+        """
+        import torch
+
+        self._require("emotion")
+        y, sr = self._as_waveform(audio)
+
+        if self.emotion_window and len(y) > int(self.emotion_window * sr):
+            result = self.predict_emotion_windowed(y)
+            return result["probs"] if return_probs else result["label"]
         
         # Process
-        inputs = self.feature_extractor(y, sampling_rate=sr, return_tensors="pt", padding=True)
+        with span("emotion.features"):
+            inputs = self.feature_extractor(y, sampling_rate=sr, return_tensors="pt", padding=True)
         
-        with torch.no_grad():
+        with span("emotion.forward"), torch.no_grad():
             logits = self.emotion_model(**inputs).logits
+
+        if return_probs:
+            return self._calibrated_probs(logits[0])
         
         predicted_ids = torch.argmax(logits, dim=-1)
         predicted_label = self.id2label[predicted_ids.item()]
         
         return predicted_label
 
+    def _calibrated_probs(self, logits):
+        import torch
+
+        probs = torch.softmax(logits / self.emotion_temperature, dim=-1).tolist()
+        return {self.id2label[i]: p for i, p in enumerate(probs)}
+
+    def predict_emotion_windowed(self, audio, window=None, hop=None, batch_size=None, aggregation=None):
+        """
+        Predicts emotion over sliding windows of the clip.
+        Windows are batched through the feature extractor and model, and their
+        logits are aggregated by pool_window_logits() ("mean", or "attention" to
+        weight confident windows more).
+        Returns:
+            { label, probs, windows: [{ start, end, label }] }
+        """
+        import torch
+
+        self._require("emotion")
+        window = window or self.emotion_window or 8.0
+        hop = hop or self.emotion_hop or window / 2
+        batch_size = batch_size or self.emotion_batch_size
+        aggregation = aggregation or self.emotion_aggregation
+
+        y, sr = self._as_waveform(audio)
+        spans = sliding_windows(len(y), int(window * sr), int(hop * sr))
+
+        window_logits = []
+        for i in range(0, len(spans), batch_size):
+            # Slices are views, so only one batch of features exists at a time
+            batch = [y[start:end] for start, end in spans[i:i + batch_size]]
+            with span("emotion.features"):
+                inputs = self.feature_extractor(batch, sampling_rate=sr, return_tensors="pt", padding=True)
+            with span("emotion.forward"), torch.no_grad():
+                window_logits.append(self.emotion_model(**inputs).logits)
+        logits = torch.cat(window_logits)
+        pooled = torch.from_numpy(pool_window_logits(logits.numpy(), aggregation, self.attention_temperature))
+
+        window_ids = torch.argmax(logits, dim=-1).tolist()
+        return {
+            "label": self.id2label[int(torch.argmax(pooled))],
+            "probs": self._calibrated_probs(pooled),
+            "windows": [
+                {"start": start / sr, "end": end / sr, "label": self.id2label[label_id]}
+                for (start, end), label_id in zip(spans, window_ids)
+            ]
+        }
+
+    def _as_waveform(self, audio):
+        if isinstance(audio, np.ndarray):
+            # Already decoded at 16k, use as-is (no copy)
+            return audio, SAMPLE_RATE
+        import librosa
+
+        # Load audio at 16k for Hubert
+        return librosa.load(audio, sr=SAMPLE_RATE)
+
+    def predict_emotion_batch(self, waveforms, return_probs=False):
+        """
+        Predicts emotion for several 16 kHz waveforms with batched forward passes.
+        Inputs are sorted by length before batching to keep padding small; clips
+        longer than the emotion window go through the windowed path instead.
+        Returns one label (or probability dict) per input, in input order.
+        """
+        import torch
+
+        self._require("emotion")
+        results = [None] * len(waveforms)
+        window = int(self.emotion_window * SAMPLE_RATE) if self.emotion_window else None
+
+        short = []
+        for i, y in enumerate(waveforms):
+            if window and len(y) > window:
+                windowed = self.predict_emotion_windowed(y)
+                results[i] = windowed["probs"] if return_probs else windowed["label"]
+            else:
+                short.append(i)
+
+        short.sort(key=lambda i: len(waveforms[i]))
+        for start in range(0, len(short), self.emotion_batch_size):
+            indices = short[start:start + self.emotion_batch_size]
+            batch = [waveforms[i] for i in indices]
+            with span("emotion.features"):
+                inputs = self.feature_extractor(batch, sampling_rate=SAMPLE_RATE, return_tensors="pt", padding=True)
+            with span("emotion.forward"), torch.no_grad():
+                logits = self.emotion_model(**inputs).logits
+            for i, row in zip(indices, logits):
+                results[i] = self._calibrated_probs(row) if return_probs else self.id2label[int(torch.argmax(row))]
+
+        return results
+
+    def _load_text_models(self):
+        """
+        Waits for the translation and text emotion pipelines.
+        Returns False if they are unavailable.
+        """
+        self._loaded["translator"].wait()
+        self._loaded["text_classifier"].wait()
+        return self.is_ready("translator") and self.is_ready("text_classifier")
+
+    def translate_sentences(self, sentences, batch_size=16):
+        """
+        Translates Japanese sentences to English, returning one translation per input.
+        Cached sentences are reused; unseen ones are translated in one batched call.
+        Returns None if the translator is unavailable.
+        """
+        if not self._load_text_models() or self.translator is None:
+            return None
+
+        translations = {}
+        unseen = []
+        for sentence in dict.fromkeys(sentences):
+            cached = self.translation_cache.get(sentence)
+            if cached is None:
+                unseen.append(sentence)
+            else:
+                translations[sentence] = cached
+
+        if unseen:
+            with span("text.translate"):
+                results = self.translator(unseen, batch_size=batch_size)
+            for sentence, result in zip(unseen, results):
+                translations[sentence] = result['translation_text']
+                self.translation_cache.put(sentence, result['translation_text'])
+
+        return [translations[sentence] for sentence in sentences]
+
+    def _classify_sentences(self, texts, batch_size=16):
+        """
+        Raw classifier scores ({ label: score } over all labels) per sentence, memoized.
+        """
+        scores = {}
+        unseen = []
+        for text in dict.fromkeys(texts):
+            cached = self.text_emotion_cache.get(text)
+            if cached is None:
+                unseen.append(text)
+            else:
+                scores[text] = cached
+
+        if unseen:
+            with span("text.classify"):
+                results = self.text_emotion_classifier(unseen, top_k=None, batch_size=batch_size)
+            for text, result in zip(unseen, results):
+                scores[text] = {entry['label']: entry['score'] for entry in result}
+                self.text_emotion_cache.put(text, scores[text])
+
+        return [scores[text] for text in texts]
+
+    def _sentence_label(self, sentences, sentence_scores):
+        """
+        Aggregates per-sentence classifier scores (weighted by sentence length)
+        and maps the top raw label to a standard label.
+        """
+        totals = {}
+        for sentence, scores in zip(sentences, sentence_scores):
+            for label, score in scores.items():
+                totals[label] = totals.get(label, 0.0) + len(sentence) * score
+        if not totals:
+            return 'neu'
+        label = max(totals, key=totals.get)
+        log_event("text.emotion_raw", label=label, score=round(totals[label] / sum(len(s) for s in sentences), 3))
+        return TEXT_LABEL_MAP.get(label, 'neu')
+
     def predict_text_emotion(self, text_ja):
         """
         Predicts emotion from Japanese text (translates to EN first).
+        The text is split into sentences; translations and classifier scores are
+        memoized per sentence, so repeated phrases skip both models.
         Returns mapped label: 'neu', 'hap', 'sad', 'ang'
         """
 
         if not text_ja:
             return 'neu'
             
-        # Lazy Load
-        if self.translator is None or self.text_emotion_classifier is None:
-            print("Loading Text Translation & Emotion models (Lazy)...")
-            try:
-                self.translator = pipeline("translation", model="Helsinki-NLP/opus-mt-ja-en")
-                self.text_emotion_classifier = pipeline("text-classification", model="cardiffnlp/twitter-roberta-base-emotion", top_k=1)
-            except Exception as e:
-                print(f"Warning: Failed to load text models: {e}")
-                return 'neu'
-
-        if not self.translator or not self.text_emotion_classifier:
-             return 'neu'
+        if not self._load_text_models():
+            return 'neu'
             
         try:
-            # 1. Translate JA -> EN
-            translation_result = self.translator(text_ja)
-            text_en = translation_result[0]['translation_text']
-            print(f"Translated: {text_en}")
+            sentences = split_sentences(text_ja)
+            if not sentences:
+                return 'neu'
+
+            if self.text_engine == "direct":
+                # Multilingual classifier reads the Japanese directly
+                texts = sentences
+            else:
+                # 1. Translate JA -> EN (unseen sentences only, batched)
+                texts = self.translate_sentences(sentences)
+                log_event("text.translated", sentences=len(texts), text=" ".join(texts))
             
-            # 2. Predict Emotion (EN)
+            # 2. Predict Emotion
             # labels: joy, optimism, anger, sadness, fear, surprise
-            results = self.text_emotion_classifier(text_en)
-            top_result = results[0][0] # top_k=1 returns list of lists
-            label = top_result['label']
-            score = top_result['score']
-            
-            print(f"Text Emotion Raw: {label} ({score})")
+            sentence_scores = self._classify_sentences(texts)
             
-            # 3. Map to standard labels
-            # Standard: neu, hap, sad, ang
-            label_map = {
-                'joy': 'hap',
-                'optimism': 'hap',
-                'anger': 'ang',
-                'sadness': 'sad',
-                'fear': 'sad', # Map fear to sad or ang? sad for now
-                'surprise': 'hap', # Map surprise to hap?
-                'neutral': 'neu'   # If model has neutral
-            }
-            
-            return label_map.get(label, 'neu')
+            # 3. Aggregate and map to standard labels
+            return self._sentence_label(sentences, sentence_scores)
             
         except Exception as e:
-            print(f"Text Emotion Error: {e}")
+            log_event("text.emotion_error", level=logging.ERROR, error=f"{type(e).__name__}: {e}")
             return 'neu'
 
-def save_audio_bytes(audio_bytes, file_path="temp_audio.wav"):
+    def predict_text_emotion_batch(self, texts_ja, batch_size=16):
+        """
+        Batched version of predict_text_emotion(): sentences from all texts are
+        translated and classified together. Returns one label per input.
+        """
+        labels = ['neu'] * len(texts_ja)
+        per_text = [split_sentences(text) if text else [] for text in texts_ja]
+        all_sentences = [sentence for sentences in per_text for sentence in sentences]
+        if not all_sentences or not self._load_text_models():
+            return labels
+
+        try:
+            if self.text_engine == "direct":
+                texts = all_sentences
+            else:
+                texts = self.translate_sentences(all_sentences, batch_size=batch_size)
+            all_scores = self._classify_sentences(texts, batch_size=batch_size)
+            offset = 0
+            for i, sentences in enumerate(per_text):
+                if sentences:
+                    labels[i] = self._sentence_label(sentences, all_scores[offset:offset + len(sentences)])
+                offset += len(sentences)
+        except Exception as e:
+            log_event("text.emotion_error", level=logging.ERROR, error=f"{type(e).__name__}: {e}")
+
+        return labels
+
+    def text_cache_stats(self):
+        return {
+            "translation": self.translation_cache.stats(),
+            "text_emotion": self.text_emotion_cache.stats()
+        }
+
+class InferenceBackend:
+    """
+    Eager fp32 PyTorch inference (the default).
+    Subclasses change how HuBERT and the text pipelines are loaded; the returned
+    objects keep the transformers interface, so AudioProcessor uses them unchanged.
+    """
+    name = "eager"
+
+    def load_audio_classifier(self, model_name):
+        """
+        Returns (feature_extractor, model) for an audio classification model.
+        """
+        from transformers import Wav2Vec2FeatureExtractor, HubertForSequenceClassification
+
+        feature_extractor = Wav2Vec2FeatureExtractor.from_pretrained(model_name)
+        model = HubertForSequenceClassification.from_pretrained(model_name)
+        return feature_extractor, model
+
+    def load_pipeline(self, task, model_name, **kwargs):
+        from transformers import pipeline
+
+        return pipeline(task, model=model_name, **kwargs)
+
+class DynamicInt8Backend(InferenceBackend):
+    """
+    Eager PyTorch with dynamic int8 quantization of the Linear layers.
+    Weights are quantized once at load; activations are quantized on the fly.
+    """
+    name = "int8"
+
+    def load_audio_classifier(self, model_name):
+        feature_extractor, model = super().load_audio_classifier(model_name)
+        return feature_extractor, self._quantize(model)
+
+    def load_pipeline(self, task, model_name, **kwargs):
+        pipe = super().load_pipeline(task, model_name, **kwargs)
+        pipe.model = self._quantize(pipe.model)
+        return pipe
+
+    def _quantize(self, model):
+        import torch
+
+        model.eval()
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+class OnnxRuntimeBackend(InferenceBackend):
+    """
+    ONNX Runtime graphs exported with optimum (`pip install optimum[onnxruntime]`).
+    Exported graphs are kept under `export_dir` and reused on the next start.
+    """
+    name = "onnx"
+
+    def __init__(self, export_dir="onnx_models"):
+        self.export_dir = export_dir
+
+    def load_audio_classifier(self, model_name):
+        from transformers import Wav2Vec2FeatureExtractor
+        from optimum.onnxruntime import ORTModelForAudioClassification
+
+        feature_extractor = Wav2Vec2FeatureExtractor.from_pretrained(model_name)
+        return feature_extractor, self._load(ORTModelForAudioClassification, model_name)
+
+    def load_pipeline(self, task, model_name, **kwargs):
+        from transformers import AutoTokenizer, pipeline
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM, ORTModelForSequenceClassification
+
+        model_class = ORTModelForSeq2SeqLM if task == "translation" else ORTModelForSequenceClassification
+        model = self._load(model_class, model_name)
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        return pipeline(task, model=model, tokenizer=tokenizer, **kwargs)
+
+    def _load(self, model_class, model_name):
+        path = os.path.join(self.export_dir, model_name.replace("/", "--"))
+        if os.path.isdir(path):
+            return model_class.from_pretrained(path)
+
+        model = model_class.from_pretrained(model_name, export=True)
+        model.save_pretrained(path)
+        return model
+
+BACKENDS = {
+    "eager": InferenceBackend,
+    "int8": DynamicInt8Backend,
+    "onnx": OnnxRuntimeBackend
+}
+
+def get_backend(backend):
+    """
+    Resolves a backend name ("eager", "int8", "onnx") or passes an InferenceBackend instance through.
+    """
+    if isinstance(backend, InferenceBackend):
+        return backend
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}'. Choose from: {', '.join(BACKENDS)}")
+    return BACKENDS[backend]()
+
+class FusionPolicy:
+    """
+    Combines audio and text emotion.
+    Text only overrides a neutral audio prediction, so the text branch is skipped
+    whenever the audio label isn't neutral. If `decisive_neutral` is set, a neutral
+    prediction at least that confident is kept without consulting the text either.
+    """
+
+    def __init__(self, neutral_label='neu', decisive_neutral=None):
+        self.neutral_label = neutral_label
+        self.decisive_neutral = decisive_neutral
+
+    def __repr__(self):
+        return f"FusionPolicy(neutral_label={self.neutral_label!r}, decisive_neutral={self.decisive_neutral!r})"
+
+    def needs_text(self, audio_probs):
+        """
+        True if the text emotion could change the fused result.
+        """
+        if max(audio_probs, key=audio_probs.get) != self.neutral_label:
+            return False
+        if self.decisive_neutral is not None and audio_probs[self.neutral_label] >= self.decisive_neutral:
+            return False
+        return True
+
+    def fuse(self, audio_probs, text_label=None):
+        # If Audio is Neutral but Text is Strong (Hap/Sad/Ang), use Text.
+        # Otherwise respect Audio (tone often conveys more truth than text sarcasm, but for simple app, text content matters).
+        audio_label = max(audio_probs, key=audio_probs.get)
+        if self.needs_text(audio_probs) and text_label and text_label != self.neutral_label:
+            return text_label
+        return audio_label
+
+def temperature_nll(logits, labels, temperature):
+    """
+    Mean negative log-likelihood of `labels` under softmax(logits / temperature).
+    """
+    scaled = np.asarray(logits, dtype=np.float64) / temperature
+    scaled -= scaled.max(axis=1, keepdims=True)
+    log_probs = scaled - np.log(np.exp(scaled).sum(axis=1, keepdims=True))
+    return float(-log_probs[np.arange(len(labels)), labels].mean())
+
+def fit_temperature(logits, labels, min_temperature=0.05, max_temperature=20.0, iterations=100):
+    """
+    Temperature scaling: the temperature minimising the NLL of `labels`
+    (class indices) under softmax(logits / T). The NLL is convex in 1/T,
+    so a golden-section search over 1/T finds the optimum.
+    Log-probabilities work as logits too, since softmax ignores a per-row shift.
+    """
+    logits = np.asarray(logits, dtype=np.float64)
+    labels = np.asarray(labels, dtype=np.int64)
+    ratio = (np.sqrt(5) - 1) / 2
+    low, high = 1 / max_temperature, 1 / min_temperature
+    for _ in range(iterations):
+        a = high - ratio * (high - low)
+        b = low + ratio * (high - low)
+        if temperature_nll(logits, labels, 1 / a) < temperature_nll(logits, labels, 1 / b):
+            high = b
+        else:
+            low = a
+    return 2 / (low + high)
+
+def load_calibration(path):
+    """
+    Reads the emotion temperature written by calibrate_emotion.py.
+    Returns 1.0 (uncalibrated) if the file doesn't exist.
+    """
+    if not path or not os.path.exists(path):
+        return 1.0
+    with open(path) as f:
+        return float(json.load(f)["emotion_temperature"])
+
+# Approximate resident memory (MB) of each Whisper size with int8 CTranslate2 weights
+ASR_MODEL_MB = {
+    "tiny": 100,
+    "base": 200,
+    "small": 600,
+    "medium": 1600,
+    "large-v3": 3200
+}
+
+class AsrTier:
+    """
+    One Whisper configuration. `language=None` auto-detects the language;
+    pinning it skips detection. `cost` is the initial guess of compute seconds
+    per second of audio, refined from observed runs.
+    """
+
+    def __init__(self, name, model_size, beam_size, language=None, cost=0.5):
+        self.name = name
+        self.model_size = model_size
+        self.beam_size = beam_size
+        self.language = language
+        self.cost = cost
+
+    def __repr__(self):
+        return f"{self.name}:{self.model_size}/beam{self.beam_size}/{self.language or 'auto'}"
+
+# The fixed configuration used when no adaptive policy is set
+DEFAULT_ASR_TIER = AsrTier("default", "small", 5)
+
+# Most accurate first
+DEFAULT_ASR_TIERS = (
+    AsrTier("accurate", "small", 5, cost=0.5),
+    AsrTier("balanced", "small", 1, language="ja", cost=0.25),
+    AsrTier("fast", "base", 1, language="ja", cost=0.1),
+    AsrTier("fastest", "tiny", 1, language="ja", cost=0.05)
+)
+
+class AdaptiveAsrPolicy:
+    """
+    Picks a Whisper tier per request from a latency budget.
+    The expected latency of a tier is its cost per audio second x the clip
+    duration x (requests ahead + 1); the most accurate tier that fits the
+    budget wins, otherwise the fastest one. Costs are updated from observed
+    runs with an exponential moving average, so the estimates follow the hardware.
+    observe() expects the time a request would have taken alone (see
+    AudioProcessor._asr_tick()), otherwise concurrent load would be counted twice.
+
+    Model sizes are kept resident in tier order as long as they fit in
+    `memory_cap_mb` (see ASR_MODEL_MB); the first tier's model is always loaded.
+    """
+
+    def __init__(self, latency_budget=5.0, tiers=DEFAULT_ASR_TIERS, memory_cap_mb=1024, smoothing=0.8):
+        self.latency_budget = latency_budget
+        self.tiers = tuple(tiers)
+        self.memory_cap_mb = memory_cap_mb
+        self.smoothing = smoothing
+        self.costs = {tier.name: tier.cost for tier in self.tiers}
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        # Only what changes the transcript; the budget and learned costs only pick between tiers
+        return f"AdaptiveAsrPolicy(tiers={list(self.tiers)!r})"
+
+    def __getstate__(self):
+        # Picklable for worker processes
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self):
+        return self.tiers[0]
+
+    def is_full_quality(self, tier_name):
+        """
+        True if a result served by this tier can be cached like any other.
+        """
+        return tier_name is None or tier_name == self.primary.name
+
+    def estimate(self, tier, duration, queue_depth=0):
+        return self.costs[tier.name] * duration * (queue_depth + 1)
+
+    def choose(self, duration, queue_depth=0, latency_budget=None, resident=None):
+        """
+        Returns the tier for a clip of `duration` seconds with `queue_depth` requests ahead of it.
+        With `resident` (a set of loaded model sizes), only tiers using those sizes are considered.
+        """
+        budget = self.latency_budget if latency_budget is None else latency_budget
+        candidates = [tier for tier in self.tiers if resident is None or tier.model_size in resident]
+        candidates = candidates or [self.primary]
+        for tier in candidates:
+            if self.estimate(tier, duration, queue_depth) <= budget:
+                return tier
+        return candidates[-1]
+
+    def observe(self, tier, duration, seconds):
+        if duration <= 0:
+            return
+        with self._lock:
+            self.costs[tier.name] = self.smoothing * self.costs[tier.name] + (1 - self.smoothing) * seconds / duration
+
+    def model_sizes(self):
+        """
+        Model sizes in tier order, stopping once the memory cap would be exceeded.
+        """
+        sizes = [self.primary.model_size]
+        used = ASR_MODEL_MB.get(self.primary.model_size, 0)
+        for tier in self.tiers[1:]:
+            if tier.model_size in sizes:
+                continue
+            size_mb = ASR_MODEL_MB.get(tier.model_size, 0)
+            if used + size_mb > self.memory_cap_mb:
+                continue
+            sizes.append(tier.model_size)
+            used += size_mb
+        return sizes
+
+def split_sentences(text):
+    """
+    Splits a transcript into sentences on sentence-final punctuation (SENTENCE_ENDINGS).
+    A "." only ends a sentence before whitespace or the end of the text, so
+    decimals and abbreviations like "3.5" stay intact.
+    Japanese transcripts are also split on the spaces between Whisper segments,
+    since Whisper often omits punctuation in Japanese.
+    """
+    separator = r'\s' if re.search(r'[\u3040-\u30ff\u4e00-\u9fff]', text) else r'\n'
+    pattern = rf'(?:[^。！？!?.{separator}]|\.(?!\s|$))+[。！？!?.]*'
+    return [sentence.strip() for sentence in re.findall(pattern, text) if sentence.strip()]
+
+class VadStats:
+    """
+    Result of voice activity trimming: how much audio was kept and dropped.
+    """
+
+    def __init__(self, total_seconds, speech_seconds, segments):
+        self.total_seconds = total_seconds
+        self.speech_seconds = speech_seconds
+        self.segments = segments # [(start_sec, end_sec)] of kept speech
+
+    @property
+    def dropped_seconds(self):
+        return self.total_seconds - self.speech_seconds
+
+    @property
+    def speech_detected(self):
+        return self.speech_seconds > 0
+
+    def to_dict(self):
+        return {
+            "total_seconds": round(self.total_seconds, 3),
+            "speech_seconds": round(self.speech_seconds, 3),
+            "dropped_seconds": round(self.dropped_seconds, 3),
+            "segments": [[round(start, 3), round(end, 3)] for start, end in self.segments]
+        }
+
+def detect_speech(waveform, sampling_rate=SAMPLE_RATE, frame_ms=30, threshold_db=-45.0, margin_db=10.0,
+                  min_speech_ms=250, padding_ms=200, flatness_threshold=0.3):
+    """
+    Energy and spectral-flatness voice activity detection.
+    A frame is speech if its RMS level is above both an absolute floor
+    (`threshold_db` dBFS) and the estimated noise floor plus `margin_db`, and
+    its spectral flatness (100 Hz - 4 kHz) is below `flatness_threshold`.
+    The flatness check rejects broadband background noise (hiss, fans, hum of
+    a room), which is flat where voiced speech is harmonic; None disables it.
+    Returns merged (start, end) sample spans, padded by `padding_ms` on each side.
+    """
+    frame = max(1, int(sampling_rate * frame_ms / 1000))
+    num_frames = len(waveform) // frame
+    if num_frames == 0:
+        return []
+
+    frames = waveform[:num_frames * frame].reshape(num_frames, frame)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    level_db = 20 * np.log10(rms + 1e-10)
+
+    # Quietest 10% of frames approximates the background noise level.
+    # Capped below the peak so a clip that is loud throughout isn't dropped entirely.
+    noise_floor = np.percentile(level_db, 10)
+    adaptive_db = min(noise_floor + margin_db, level_db.max() - margin_db)
+    is_speech = level_db > max(threshold_db, adaptive_db)
+    if flatness_threshold is not None:
+        is_speech &= spectral_flatness(frames, sampling_rate) < flatness_threshold
+
+    spans = []
+    start = None
+    for i, speech in enumerate(np.append(is_speech, False)):
+        if speech and start is None:
+            start = i
+        elif not speech and start is not None:
+            spans.append((start * frame, i * frame))
+            start = None
+
+    min_speech = int(sampling_rate * min_speech_ms / 1000)
+    padding = int(sampling_rate * padding_ms / 1000)
+    merged = []
+    for start, end in spans:
+        if end - start < min_speech:
+            continue
+        start, end = max(0, start - padding), min(len(waveform), end + padding)
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def spectral_flatness(frames, sampling_rate=SAMPLE_RATE, low_hz=100, high_hz=4000):
+    """
+    Per-frame spectral flatness (geometric / arithmetic mean of the power spectrum)
+    within the speech band: ~0.55 for white noise, close to 0 for harmonic sounds.
+    """
+    power = np.abs(np.fft.rfft(frames * np.hanning(frames.shape[1]), axis=1)) ** 2
+    freqs = np.fft.rfftfreq(frames.shape[1], 1 / sampling_rate)
+    power = power[:, (freqs >= low_hz) & (freqs <= high_hz)] + 1e-12
+    return np.exp(np.mean(np.log(power), axis=1)) / np.mean(power, axis=1)
+
+def trim_silence(waveform, sampling_rate=SAMPLE_RATE, **vad_options):
+    """
+    Drops non-speech from a waveform.
+    Returns (trimmed_waveform, VadStats). The waveform is returned as-is when nothing is dropped.
+    """
+    spans = detect_speech(waveform, sampling_rate, **vad_options)
+    total = len(waveform) / sampling_rate
+
+    if not spans:
+        return waveform[:0], VadStats(total, 0.0, [])
+    if len(spans) == 1 and spans[0] == (0, len(waveform)):
+        return waveform, VadStats(total, total, [(0.0, total)])
+
+    trimmed = np.concatenate([waveform[start:end] for start, end in spans])
+    segments = [(start / sampling_rate, end / sampling_rate) for start, end in spans]
+    return trimmed, VadStats(total, len(trimmed) / sampling_rate, segments)
+
+def sliding_windows(num_samples, window, hop):
+    """
+    Returns (start, end) sample spans of `window` samples every `hop` samples.
+    The last window is aligned to the end of the clip so every window has the same length.
+    """
+    if num_samples <= window:
+        return [(0, num_samples)]
+    spans = [(start, start + window) for start in range(0, num_samples - window + 1, hop)]
+    if spans[-1][1] < num_samples:
+        spans.append((num_samples - window, num_samples))
+    return spans
+
+def pool_window_logits(logits, aggregation="mean", temperature=1.0):
+    """
+    Pools per-window logits (windows x labels) into one logit vector.
+    "attention" weights each window by softmax(margin / temperature), where the
+    margin is its top logit minus the runner-up. Margins span several logit
+    units, so a confident window can outweigh an ambiguous one many times over.
+    """
+    logits = np.asarray(logits)
+    if aggregation == "mean" or len(logits) == 1:
+        return logits.mean(axis=0)
+    if aggregation != "attention":
+        raise ValueError(f"Unknown aggregation '{aggregation}'. Choose 'mean' or 'attention'.")
+    top2 = np.sort(logits, axis=1)[:, -2:]
+    scores = (top2[:, 1] - top2[:, 0]) / temperature
+    weights = np.exp(scores - scores.max())
+    weights /= weights.sum()
+    return (logits * weights[:, None]).sum(axis=0)
+
+class AnalysisCache:
+    """
+    Content-addressed LRU cache for analyze() results.
+    Bounded by entry count and by the serialized size of the stored results.
+    If `path` is given, entries are also persisted to a SQLite file so they
+    survive restarts and are shared between processes. Hits don't write to
+    the file: their access times are batched and written with the next put(),
+    every `touch_batch` hits, or on flush().
+    """
+
+    def __init__(self, max_entries=512, max_bytes=8 * 1024 * 1024, path=None, touch_batch=64):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict() # key -> (value, size)
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        self.touch_batch = touch_batch
+        self._touched = {} # key -> access time not yet written to disk
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS analysis_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, key, count_miss=True):
+        """
+        Returns the cached value or None. With count_miss=False a miss isn't
+        counted, for pre-checks that are followed by a counted lookup.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                self._touch_disk(key)
+                return entry[0]
+
+            value = self._load_disk(key)
+            if value is None:
+                self.misses += count_miss
+                return None
+
+            # Promote the persisted entry into memory
+            self.hits += 1
+            self._insert(key, value, len(json.dumps(value)))
+            self._touch_disk(key)
+            return value
+
+    def put(self, key, value):
+        payload = json.dumps(value)
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            self._insert(key, value, size)
+            if self._db is not None:
+                self._touched.pop(key, None)
+                self._write_touches()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO analysis_cache (key, value, size, last_access) VALUES (?, ?, ?, ?)",
+                    (key, payload, size, time.time())
+                )
+                self._evict_disk()
+                self._db.commit()
+
+    def flush(self):
+        """
+        Writes pending access times to disk.
+        """
+        with self._lock:
+            if self._db is not None and self._touched:
+                self._write_touches()
+                self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _insert(self, key, value, size):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._total_bytes -= old[1]
+        self._entries[key] = (value, size)
+        self._total_bytes += size
+
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            _, (_, evicted_size) = self._entries.popitem(last=False)
+            self._total_bytes -= evicted_size
+
+    def _load_disk(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute("SELECT value FROM analysis_cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def _touch_disk(self, key):
+        if self._db is None:
+            return
+        self._touched[key] = time.time()
+        if len(self._touched) >= self.touch_batch:
+            self._write_touches()
+            self._db.commit()
+
+    def _write_touches(self):
+        # One statement for all hits since the last write; the caller commits
+        self._db.executemany(
+            "UPDATE analysis_cache SET last_access = ? WHERE key = ?",
+            [(accessed, key) for key, accessed in self._touched.items()]
+        )
+        self._touched.clear()
+
+    def _evict_disk(self):
+        # Same bounds as memory: drop least recently used rows first
+        count, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM analysis_cache").fetchone()
+        while count > self.max_entries or total > self.max_bytes:
+            row = self._db.execute(
+                "SELECT key, size FROM analysis_cache ORDER BY last_access ASC LIMIT 1"
+            ).fetchone()
+            if row is None:
+                break
+            self._db.execute("DELETE FROM analysis_cache WHERE key = ?", (row[0],))
+            count -= 1
+            total -= row[1]
+
+def audio_cache_key(audio, model_versions=""):
+    """
+    Builds a cache key from the audio content plus the model versions that produced the result.
+    Accepts raw bytes, a file-like buffer or a decoded waveform.
+    """
+    digest = hashlib.sha256()
+    digest.update(model_versions.encode("utf-8"))
+    if isinstance(audio, np.ndarray):
+        digest.update(str(audio.dtype).encode("utf-8"))
+        digest.update(np.ascontiguousarray(audio).data)
+    elif hasattr(audio, "read"):
+        position = audio.tell()
+        digest.update(audio.read())
+        audio.seek(position)
+    else:
+        digest.update(audio)
+    return digest.hexdigest()
+
+def decode_audio_bytes(audio, sampling_rate=SAMPLE_RATE):
+    """
+    Decodes raw audio bytes or a file-like buffer into a mono float32 waveform.
+    Decoding happens in memory, so nothing is written to disk.
+    """
+    from faster_whisper import decode_audio
+
+    if isinstance(audio, (bytes, bytearray, memoryview)):
+        audio = io.BytesIO(audio)
+    with span("audio.decode"):
+        return decode_audio(audio, sampling_rate=sampling_rate)
+
+def audio_duration(path):
     """
-    Saves bytes to a wav file.
+    Duration in seconds of an audio file, read from its header where possible
+    so picking an ASR tier doesn't decode the whole file.
     """
-    with open(file_path, "wb") as f:
-        f.write(audio_bytes)
-    return file_path
+    try:
+        import soundfile
+        return soundfile.info(path).duration
+    except (ImportError, RuntimeError):
+        # Not installed, or a format libsndfile can't read (e.g. m4a)
+        pass
+    try:
+        import av
+        with av.open(path) as container:
+            if container.duration is not None:
+                return container.duration / av.time_base
+    except Exception:
+        pass
+    return len(decode_audio_bytes(path)) / SAMPLE_RATE
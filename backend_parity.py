@@ -0,0 +1,166 @@
+"""
+Parity check for the quantized / ONNX inference backends.
+
+Usage:
+    python backend_parity.py --backend int8 --clips recordings/
+    python backend_parity.py --backend onnx --min-agreement 0.95 --max-prob-diff 0.05
+
+Runs HuBERT and the text emotion chain on a set of clips and fixed sentences
+with the eager fp32 backend and the candidate backend. Prints label agreement,
+the largest absolute probability difference, mean KL divergence and latency,
+and exits non-zero if agreement falls below --min-agreement or a probability
+moves by more than --max-prob-diff.
+
+Use real speech with --clips (or MOODVIBES_PARITY_CLIPS for the pytest):
+HuBERT tends to give synthetic signals the same label, so on the built-in
+synthetic clips label agreement is trivially high and only the probability
+comparison can catch drift.
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from audio_utils import AudioProcessor, SAMPLE_RATE, decode_audio_bytes
+from eval_sentences import PARITY_SENTENCES
+
+AUDIO_EXTENSIONS = (".wav", ".flac", ".mp3", ".m4a", ".ogg", ".webm")
+
+def make_parity_clips(seed=0, seconds=3.0):
+    """
+    Deterministic synthetic clips: tones, harmonic "voiced" signals with
+    pitch contours, amplitude-modulated noise and mixtures of these.
+    """
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    clips = []
+
+    for pitch in (110.0, 180.0, 260.0):
+        clips.append(0.3 * np.sin(2 * np.pi * pitch * t))
+
+    for pitch, vibrato in ((120.0, 3.0), (200.0, 6.0), (300.0, 9.0)):
+        phase = 2 * np.pi * np.cumsum(pitch * (1 + 0.05 * np.sin(2 * np.pi * vibrato * t))) / SAMPLE_RATE
+        voiced = sum(np.sin(k * phase) / k for k in range(1, 6))
+        clips.append(0.2 * voiced * (0.6 + 0.4 * np.sin(2 * np.pi * 2.0 * t)))
+
+    for rate in (2.0, 5.0):
+        noise = rng.normal(0, 0.1, len(t))
+        clips.append(noise * (0.5 + 0.5 * np.sin(2 * np.pi * rate * t)))
+
+    clips.append(0.5 * clips[1] + 0.5 * clips[6])
+    clips.append(0.7 * clips[4] + rng.normal(0, 0.02, len(t)))
+
+    return [clip.astype(np.float32) for clip in clips]
+
+def load_parity_clips(directory):
+    """
+    Every audio file in `directory` (sorted by name), decoded to 16 kHz mono.
+    """
+    names = sorted(name for name in os.listdir(directory) if name.lower().endswith(AUDIO_EXTENSIONS))
+    if not names:
+        raise ValueError(f"No audio files ({', '.join(AUDIO_EXTENSIONS)}) in {directory}")
+    return [decode_audio_bytes(os.path.join(directory, name)) for name in names]
+
+def text_probs(processor, sentence):
+    """
+    Raw classifier scores for one sentence, through the backend's own translation.
+    """
+    texts = [sentence] if processor.text_engine == "direct" else processor.translate_sentences([sentence])
+    return processor._classify_sentences(texts)[0]
+
+def run_backend(backend, clips, sentences):
+    """
+    Labels, probabilities and latency for one backend:
+        { audio_labels, audio_probs, audio_seconds, text_labels, text_probs, text_seconds, load_errors }
+    """
+    processor = AudioProcessor(backend=backend)
+
+    start = time.perf_counter()
+    audio_probs = [processor.predict_emotion(clip, return_probs=True) for clip in clips]
+    audio_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    text_labels = [processor.predict_text_emotion(sentence) for sentence in sentences]
+    text_seconds = time.perf_counter() - start
+    sentence_probs = [text_probs(processor, sentence) for sentence in sentences]
+
+    return {
+        "audio_labels": [max(probs, key=probs.get) for probs in audio_probs],
+        "audio_probs": audio_probs,
+        "audio_seconds": audio_seconds,
+        "text_labels": text_labels,
+        "text_probs": sentence_probs,
+        "text_seconds": text_seconds,
+        "load_errors": processor.load_errors,
+    }
+
+def agreement(reference, candidate):
+    return sum(a == b for a, b in zip(reference, candidate)) / len(reference)
+
+def max_prob_diff(reference, candidate):
+    """
+    Largest absolute difference of any label's probability over all inputs.
+    """
+    return max(abs(ref[label] - cand.get(label, 0.0)) for ref, cand in zip(reference, candidate) for label in ref)
+
+def mean_kl(reference, candidate, eps=1e-8):
+    """
+    Mean KL(reference || candidate) in nats over all inputs.
+    """
+    total = 0.0
+    for ref, cand in zip(reference, candidate):
+        total += sum(p * np.log((p + eps) / (cand.get(label, 0.0) + eps)) for label, p in ref.items())
+    return total / len(reference)
+
+def compare(reference, candidate):
+    """
+    { audio: {agreement, max_prob_diff, kl}, text: {...} } for two run_backend() results.
+    """
+    return {
+        branch: {
+            "agreement": agreement(reference[f"{branch}_labels"], candidate[f"{branch}_labels"]),
+            "max_prob_diff": max_prob_diff(reference[f"{branch}_probs"], candidate[f"{branch}_probs"]),
+            "kl": mean_kl(reference[f"{branch}_probs"], candidate[f"{branch}_probs"]),
+        }
+        for branch in ("audio", "text")
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare an inference backend's labels and probabilities against eager fp32.")
+    parser.add_argument("--backend", default="int8", help="candidate backend: int8 or onnx")
+    parser.add_argument("--clips", default=os.getenv("MOODVIBES_PARITY_CLIPS"), help="directory of real speech clips (default: synthetic)")
+    parser.add_argument("--min-agreement", type=float, default=0.9, help="fail below this label agreement")
+    parser.add_argument("--max-prob-diff", type=float, default=0.1, help="fail if any probability moves by more than this")
+    args = parser.parse_args(argv)
+
+    if args.clips:
+        clips = load_parity_clips(args.clips)
+    else:
+        print("No --clips given: using synthetic clips, which only catch gross probability drift")
+        clips = make_parity_clips()
+    reference = run_backend("eager", clips, PARITY_SENTENCES)
+    candidate = run_backend(args.backend, clips, PARITY_SENTENCES)
+    results = compare(reference, candidate)
+
+    print(f"{'':<8} {'agreement':>10} {'max |dp|':>9} {'KL':>8} {'eager':>9} {args.backend:>9}")
+    for branch in ("audio", "text"):
+        r = results[branch]
+        print(f"{branch:<8} {r['agreement']:>10.0%} {r['max_prob_diff']:>9.3f} {r['kl']:>8.4f} "
+              f"{reference[f'{branch}_seconds']:>8.2f}s {candidate[f'{branch}_seconds']:>8.2f}s")
+
+    failed = False
+    if min(r["agreement"] for r in results.values()) < args.min_agreement:
+        print(f"FAIL: agreement below {args.min_agreement:.0%}")
+        failed = True
+    if max(r["max_prob_diff"] for r in results.values()) > args.max_prob_diff:
+        print(f"FAIL: a probability moved by more than {args.max_prob_diff}")
+        failed = True
+    if failed:
+        return 1
+    print("OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
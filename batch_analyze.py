@@ -0,0 +1,196 @@
+"""
+Offline batch analysis for archives of recordings.
+
+Usage:
+    python batch_analyze.py recordings/ -o results.jsonl
+    python batch_analyze.py manifest.txt -o results.jsonl --batch-size 32
+
+The input is a directory (searched recursively) or a manifest file with one
+audio path per line. Results are appended to the output as JSON lines while
+the run progresses; re-running with the same output skips files that already
+have a result, so an interrupted run resumes where it stopped.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from audio_utils import AudioProcessor
+from metrics import configure_logging
+
+AUDIO_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.flac', '.ogg')
+
+def iter_inputs(source):
+    """
+    Yields audio paths from a directory or a manifest file, without listing everything up front.
+    """
+    if os.path.isdir(source):
+        for root, dirs, files in os.walk(source):
+            dirs.sort()
+            for name in sorted(files):
+                if name.lower().endswith(AUDIO_EXTENSIONS):
+                    yield os.path.join(root, name)
+    else:
+        base = os.path.dirname(os.path.abspath(source))
+        with open(source, encoding="utf-8") as f:
+            for line in f:
+                path = line.strip()
+                if path and not path.startswith("#"):
+                    yield path if os.path.isabs(path) else os.path.join(base, path)
+
+def load_done(output_path):
+    """
+    Paths that already have a successful result in the output file.
+    Error records (which are retried) and a partial last line from an
+    interrupted run are removed from the file, so every path ends up with
+    exactly one record after the resumed run.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    kept = []
+    dropped = 0
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Partial last line from an interrupted run
+                dropped += 1
+                continue
+            if "error" in record or record["path"] in done:
+                dropped += 1
+                continue
+            done.add(record["path"])
+            kept.append(line if line.endswith("\n") else line + "\n")
+
+    if dropped:
+        temp_path = output_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            f.writelines(kept)
+        os.replace(temp_path, output_path)
+    return done
+
+def iter_batches(paths, batch_size):
+    batch = []
+    for path in paths:
+        batch.append(path)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+class BatchAnalyzer:
+    """
+    Runs AudioProcessor.analyze_batch() over many files. Decoding happens on
+    a worker pool one batch ahead of inference, and time is accounted per stage.
+    """
+
+    def __init__(self, processor, decode_workers=4, batch_size=16):
+        self.processor = processor
+        self.batch_size = batch_size
+        self.decode_pool = ThreadPoolExecutor(max_workers=decode_workers, thread_name_prefix="decode")
+        self.stage_seconds = {"decode": 0.0, "vad": 0.0, "transcribe": 0.0, "audio_emotion": 0.0, "text_emotion": 0.0}
+        self.files = 0
+        self.errors = 0
+
+    def _decode(self, path):
+        start = time.perf_counter()
+        try:
+            return path, self.processor.load_audio(path), None, time.perf_counter() - start
+        except Exception as e:
+            return path, None, str(e), time.perf_counter() - start
+
+    def _submit(self, batch):
+        return [self.decode_pool.submit(self._decode, path) for path in batch]
+
+    def run(self, paths, output_path):
+        batches = iter_batches(paths, self.batch_size)
+        pending = next(batches, None)
+        pending = self._submit(pending) if pending else None
+
+        with open(output_path, "a", encoding="utf-8") as out:
+            while pending:
+                decoded = [future.result() for future in pending]
+
+                # Start decoding the next batch while this one runs through the models
+                next_batch = next(batches, None)
+                pending = self._submit(next_batch) if next_batch else None
+
+                for record in self.process_batch(decoded):
+                    out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+
+    def process_batch(self, decoded):
+        records = []
+        items = []
+
+        for path, waveform, error, seconds in decoded:
+            self.stage_seconds["decode"] += seconds
+            self.files += 1
+            if error is not None:
+                self.errors += 1
+                records.append({"path": path, "error": error})
+            else:
+                items.append((path, waveform))
+
+        if items:
+            try:
+                results = self.processor.analyze_batch([waveform for _, waveform in items], stage_seconds=self.stage_seconds)
+                records.extend({"path": path, **result} for (path, _), result in zip(items, results))
+            except Exception:
+                # One bad clip shouldn't fail the batch (or the run): retry file by file
+                records.extend(self._process_individually(items))
+
+        return records
+
+    def _process_individually(self, items):
+        records = []
+        for path, waveform in items:
+            try:
+                result = self.processor.analyze_batch([waveform], stage_seconds=self.stage_seconds)[0]
+                records.append({"path": path, **result})
+            except Exception as e:
+                self.errors += 1
+                records.append({"path": path, "error": f"{type(e).__name__}: {e}"})
+        return records
+
+    def report(self, elapsed):
+        rate = self.files / elapsed if elapsed > 0 else 0.0
+        lines = [f"Processed {self.files} files ({self.errors} errors) in {elapsed:.1f}s: {rate:.2f} files/sec"]
+        for stage, seconds in self.stage_seconds.items():
+            lines.append(f"  {stage:<14} {seconds:8.1f}s")
+        return "\n".join(lines)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Label a directory or manifest of recordings with MoodVibes emotions.")
+    parser.add_argument("input", help="directory of audio files, or a manifest with one path per line")
+    parser.add_argument("-o", "--output", default="results.jsonl", help="JSONL output (appended to; existing results are skipped)")
+    parser.add_argument("--batch-size", type=int, default=16, help="files per model batch")
+    parser.add_argument("--decode-workers", type=int, default=4, help="threads decoding audio ahead of inference")
+    parser.add_argument("--no-vad", action="store_true", help="don't trim non-speech before inference")
+    args = parser.parse_args(argv)
+    configure_logging()
+
+    done = load_done(args.output)
+    if done:
+        print(f"Resuming: {len(done)} files already in {args.output}")
+    paths = (path for path in iter_inputs(args.input) if path not in done)
+
+    processor = AudioProcessor(emotion_window=8.0, emotion_batch_size=args.batch_size, vad=not args.no_vad)
+    analyzer = BatchAnalyzer(processor, decode_workers=args.decode_workers, batch_size=args.batch_size)
+
+    start = time.perf_counter()
+    try:
+        analyzer.run(paths, args.output)
+    except KeyboardInterrupt:
+        print("Interrupted; re-run the same command to resume.")
+    print(analyzer.report(time.perf_counter() - start))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
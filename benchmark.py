@@ -0,0 +1,375 @@
+"""
+Reproducible benchmark of the audio and recommendation pipeline.
+
+Usage:
+    python benchmark.py --output bench.json
+    python benchmark.py --durations 1 10 --repeats 5 --skip-spotify
+    python benchmark.py --skip-audio --spotify-latency 0.1 --spotify-429-rate 0.2
+    python benchmark.py --output new.json --baseline bench.json --max-regression 1.2
+
+Audio: deterministic synthetic clips (tone, noise, silence and a mixture of
+the three) from 1 s to 10 min are run through AudioProcessor.transcribe()
+and predict_emotion(); a fixed Japanese sentence set goes through
+predict_text_emotion() with cold and warm caches.
+
+Spotify: SpotifyClient.get_recommendations() runs against a local stub of
+the Web API with configurable latency and 429 injection, for every
+mood x genre key with a cold cache and then a warm one.
+
+Latency percentiles, throughput, peak RSS, model load times and the
+per-stage metrics are written as JSON (sorted keys, rounded values) so two
+runs can be diffed. With --baseline, p95 latencies are compared against an
+earlier run and the exit status is non-zero if any got slower than
+--max-regression times the baseline.
+"""
+import sys
+import json
+import time
+import random
+import logging
+import platform
+import argparse
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from audio_utils import AudioProcessor, SAMPLE_RATE
+from eval_sentences import PARITY_SENTENCES
+from metrics import METRICS, current_rss_bytes, peak_rss_bytes
+
+CLIP_KINDS = ("tone", "noise", "silence", "mixture")
+
+def make_clip(kind, seconds, seed=0):
+    """
+    Deterministic synthetic clip. The same (kind, seconds, seed) always gives the same samples.
+    """
+    rng = np.random.default_rng([seed, CLIP_KINDS.index(kind), int(seconds * 1000)])
+    n = int(seconds * SAMPLE_RATE)
+    t = np.arange(n, dtype=np.float32) / SAMPLE_RATE
+
+    if kind == "tone":
+        # Harmonic tone with a slow pitch contour, roughly voice-like
+        pitch = 150.0 * (1 + 0.1 * np.sin(2 * np.pi * 0.5 * t))
+        phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+        clip = 0.2 * sum(np.sin(k * phase) / k for k in range(1, 5))
+    elif kind == "noise":
+        clip = rng.normal(0, 0.1, n)
+    elif kind == "silence":
+        clip = np.zeros(n)
+    else:
+        # 2 s blocks cycling tone, silence, noise, tone + noise
+        tone = make_clip("tone", seconds, seed)
+        noise = make_clip("noise", seconds, seed)
+        block = (np.arange(n) // (2 * SAMPLE_RATE)) % 4
+        clip = np.select([block == 0, block == 1, block == 2], [tone, 0.0, noise], default=0.5 * (tone + noise))
+    return clip.astype(np.float32)
+
+def summarize(seconds, work=None):
+    """
+    Latency percentiles (ms) and throughput for one series of timings.
+    `work` is the amount processed per call (e.g. audio seconds) for a work/second rate.
+    """
+    seconds = np.asarray(seconds, dtype=np.float64)
+    total = float(seconds.sum())
+    summary = {
+        "count": len(seconds),
+        "mean_ms": round(1000 * float(seconds.mean()), 3),
+        "p50_ms": round(1000 * float(np.percentile(seconds, 50)), 3),
+        "p95_ms": round(1000 * float(np.percentile(seconds, 95)), 3),
+        "p99_ms": round(1000 * float(np.percentile(seconds, 99)), 3),
+        "max_ms": round(1000 * float(seconds.max()), 3),
+        "per_second": round(len(seconds) / total, 3) if total else None,
+    }
+    if work is not None:
+        # e.g. audio seconds processed per wall-clock second (x realtime)
+        summary["work_per_second"] = round(work * len(seconds) / total, 3) if total else None
+    return summary
+
+def timed(fn, *args, repeats=1):
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(*args)
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+class RssSampler:
+    """
+    Polls the current RSS from a background thread while the block runs.
+    `peak_delta` is the highest RSS seen minus the RSS on entry, so every case
+    gets its own peak even after an earlier case pushed ru_maxrss higher.
+    None where the current RSS can't be read.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.peak_delta = None
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self._baseline = self._peak = current_rss_bytes()
+        self._thread = threading.Thread(target=self._sample, name="rss-sampler", daemon=True)
+        self._thread.start()
+        return self
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._peak = max(self._peak, current_rss_bytes())
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self._peak = max(self._peak, current_rss_bytes())
+        if self._baseline:
+            self.peak_delta = self._peak - self._baseline
+        return False
+
+def bench_audio(args):
+    start = time.perf_counter()
+    with RssSampler() as rss:
+        processor = AudioProcessor(backend=args.backend, text_engine=args.text_engine, emotion_window=args.emotion_window)
+    load = {
+        "total_seconds": round(time.perf_counter() - start, 3),
+        "models": {name: round(seconds, 3) for name, seconds in processor.load_seconds.items()},
+        "errors": processor.load_errors,
+        "peak_rss_delta_bytes": rss.peak_delta,
+    }
+
+    results = {"load": load, "transcribe": {}, "predict_emotion": {}}
+    for seconds in args.durations:
+        for kind in CLIP_KINDS:
+            clip = make_clip(kind, seconds, args.seed)
+            name = f"{kind}_{seconds:g}s"
+            for method in ("transcribe", "predict_emotion"):
+                with RssSampler() as rss:
+                    timings = timed(getattr(processor, method), clip, repeats=args.repeats)
+                results[method][name] = summarize(timings, work=seconds)
+                results[method][name]["peak_rss_delta_bytes"] = rss.peak_delta
+            print(f"audio {name}: transcribe p50 {results['transcribe'][name]['p50_ms']:.0f}ms, "
+                  f"emotion p50 {results['predict_emotion'][name]['p50_ms']:.0f}ms")
+
+    cold, warm = [], []
+    for _ in range(args.repeats):
+        for sentence in PARITY_SENTENCES:
+            # Fresh caches measure the models; the second call measures the memoized path
+            processor.translation_cache = type(processor.translation_cache)()
+            processor.text_emotion_cache = type(processor.text_emotion_cache)()
+            cold += timed(processor.predict_text_emotion, sentence)
+            warm += timed(processor.predict_text_emotion, sentence)
+    results["predict_text_emotion"] = {"cold": summarize(cold), "warm": summarize(warm)}
+    return results
+
+class StubSpotify:
+    """
+    Local stand-in for the Spotify Web API search and playlist endpoints.
+    Each request sleeps `latency` seconds; a `rate_limit_rate` fraction of
+    requests (drawn from a seeded RNG) is answered with 429 and Retry-After.
+    """
+
+    def __init__(self, latency=0.05, rate_limit_rate=0.0, retry_after=0, playlists=10, tracks=10, seed=0):
+        self.latency = latency
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self.playlists = playlists
+        self.tracks = tracks
+        self.requests = 0
+        self.rate_limited = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.server = None
+
+    def start(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                stub.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.server.serve_forever, name="spotify-stub", daemon=True).start()
+        return f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def handle(self, request):
+        with self._lock:
+            self.requests += 1
+            limited = self._rng.random() < self.rate_limit_rate
+            self.rate_limited += limited
+        time.sleep(self.latency)
+
+        path = request.path.split("?")[0]
+        if limited:
+            status, body, headers = 429, {"error": {"status": 429, "message": "rate limited"}}, {"Retry-After": str(self.retry_after)}
+        elif path == "/search":
+            status, body, headers = 200, self._search(), {}
+        elif path.startswith("/playlists/"):
+            status, body, headers = 200, self._tracks(path.split("/")[2]), {}
+        else:
+            status, body, headers = 404, {"error": {"status": 404, "message": "not found"}}, {}
+
+        payload = json.dumps(body).encode("utf-8")
+        request.send_response(status)
+        request.send_header("Content-Type", "application/json")
+        request.send_header("Content-Length", str(len(payload)))
+        for key, value in headers.items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(payload)
+
+    def _search(self):
+        items = [{"id": f"pl{i}", "name": f"Playlist {i}"} for i in range(self.playlists)]
+        # The real API returns null items now and then
+        items[1] = None
+        return {"playlists": {"items": items}}
+
+    def _tracks(self, playlist_id):
+        return {"items": [
+            {"track": {
+                "id": f"{playlist_id}-t{i}",
+                "name": f"Track {i}",
+                "artists": [{"name": f"Artist {i % 4}"}],
+                "external_urls": {"spotify": f"https://open.spotify.com/track/{playlist_id}-t{i}"},
+                "album": {"images": [{"url": "https://i.scdn.co/image/stub"}]},
+            }}
+            for i in range(self.tracks)
+        ]}
+
+def bench_spotify(args):
+    import spotipy
+    from spotify_client import SpotifyClient, MOOD_MAP, GENRE_OPTIONS
+
+    # spotipy logs every 429 as an error; the stub produces them on purpose
+    logging.getLogger("spotipy").setLevel(logging.CRITICAL)
+
+    stub = StubSpotify(latency=args.spotify_latency, rate_limit_rate=args.spotify_429_rate,
+                       retry_after=args.spotify_retry_after, seed=args.seed)
+    url = stub.start()
+    try:
+        client = SpotifyClient(sp=spotipy.Spotify(auth="dummy"), playlist_fanout=args.spotify_fanout)
+        # Same pooled session as production, with 429s left to SpotifyClient._call()
+        client.sp = client._build_spotify(auth="dummy")
+        client.sp.prefix = url
+
+        keys = [(emotion, genre) for emotion in MOOD_MAP for genre in GENRE_OPTIONS]
+        cold, warm, errors = [], [], 0
+        for _ in range(args.repeats):
+            with client._cache_lock:
+                client._cache.clear()
+            for key in keys:
+                start = time.perf_counter()
+                result = client.get_recommendations(*key)
+                cold.append(time.perf_counter() - start)
+                errors += isinstance(result, dict)
+            for key in keys:
+                warm += timed(client.get_recommendations, *key)
+
+        results = {
+            "cold": summarize(cold),
+            "warm": summarize(warm),
+            "errors": errors,
+            "stub": {
+                "latency_seconds": args.spotify_latency,
+                "rate_limit_rate": args.spotify_429_rate,
+                "requests": stub.requests,
+                "rate_limited": stub.rate_limited,
+            },
+            "playlist_fanout": args.spotify_fanout,
+        }
+        print(f"spotify: cold p50 {results['cold']['p50_ms']:.0f}ms p95 {results['cold']['p95_ms']:.0f}ms, "
+              f"{stub.rate_limited}/{stub.requests} requests rate limited, {errors} errors")
+        return results
+    finally:
+        stub.stop()
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def p95_series(report, path=()):
+    """
+    Flattens a report into { "section/name": p95_ms } for every latency summary in it.
+    """
+    series = {}
+    for key, value in report.items():
+        if isinstance(value, dict):
+            if "p95_ms" in value:
+                series["/".join(path + (key,))] = value["p95_ms"]
+            else:
+                series.update(p95_series(value, path + (key,)))
+    return series
+
+def compare(report, baseline, max_regression):
+    current = p95_series(report["results"])
+    previous = p95_series(baseline["results"])
+    regressions = []
+    for name in sorted(current.keys() & previous.keys()):
+        # Sub-millisecond timings (cache hits) are floored so jitter doesn't count as a regression
+        ratio = max(current[name], 1.0) / max(previous[name], 1.0)
+        if ratio > max_regression:
+            regressions.append(name)
+        print(f"{name:<45} {previous[name]:>10.1f}ms {current[name]:>10.1f}ms {ratio:>6.2f}x{'  REGRESSION' if ratio > max_regression else ''}")
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the audio models and the Spotify client.")
+    parser.add_argument("--output", default="benchmark.json", help="JSON report path")
+    parser.add_argument("--durations", type=float, nargs="+", default=[1, 10, 60, 600], help="clip lengths in seconds")
+    parser.add_argument("--repeats", type=int, default=3, help="timed runs per case")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--backend", default="eager", help="eager, int8 or onnx")
+    parser.add_argument("--text-engine", default="translate", help="translate or direct")
+    parser.add_argument("--emotion-window", type=float, default=8.0, help="seconds per HuBERT window for long clips")
+    parser.add_argument("--skip-audio", action="store_true")
+    parser.add_argument("--skip-spotify", action="store_true")
+    parser.add_argument("--spotify-latency", type=float, default=0.05, help="stub server delay per request (s)")
+    parser.add_argument("--spotify-429-rate", type=float, default=0.1, help="fraction of stub requests answered with 429")
+    parser.add_argument("--spotify-retry-after", type=int, default=0, help="Retry-After sent with injected 429s (s)")
+    parser.add_argument("--spotify-fanout", type=int, default=3, help="SpotifyClient playlist_fanout")
+    parser.add_argument("--baseline", help="earlier report to compare p95 latencies against")
+    parser.add_argument("--max-regression", type=float, default=1.2, help="fail if a p95 exceeds baseline by this factor")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if not args.skip_audio:
+        results["audio"] = bench_audio(args)
+    if not args.skip_spotify:
+        results["spotify"] = bench_spotify(args)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": {key: value for key, value in vars(args).items() if key not in ("output", "baseline")},
+        },
+        "peak_rss_bytes": peak_rss_bytes(),
+        "stages": METRICS.snapshot(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print(f"Wrote {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.max_regression)
+        if regressions:
+            print(f"FAIL: {len(regressions)} p95 latencies regressed more than {args.max_regression:.2f}x")
+            return 1
+        print("OK")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,64 @@
+"""
+Fits the temperature used to calibrate HuBERT's emotion probabilities.
+
+Usage:
+    python calibrate_emotion.py labels.csv
+    python calibrate_emotion.py labels.csv --output calibration.json
+
+labels.csv has one held-out clip per line: path,label (label is one of
+neu, hap, sad, ang). Every clip is scored with the uncalibrated model, the
+temperature minimising the negative log-likelihood of the labels is fitted
+(fit_temperature()) and written to --output, which the app loads through
+MOODVIBES_CALIBRATION_PATH.
+"""
+import sys
+import csv
+import json
+import argparse
+
+import numpy as np
+
+from audio_utils import AudioProcessor, fit_temperature, temperature_nll
+
+def read_labels(path):
+    with open(path, newline="") as f:
+        return [(row[0], row[1].strip()) for row in csv.reader(f) if row and not row[0].startswith("#")]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fit the HuBERT emotion temperature on labelled clips.")
+    parser.add_argument("labels", help="CSV of path,label")
+    parser.add_argument("--output", default="calibration.json", help="where to write the fitted temperature")
+    parser.add_argument("--emotion-window", type=float, default=8.0, help="same window as the app, so logits match")
+    args = parser.parse_args(argv)
+
+    clips = read_labels(args.labels)
+    processor = AudioProcessor(emotion_window=args.emotion_window, emotion_temperature=1.0)
+    label_ids = {label: i for i, label in processor.id2label.items()}
+
+    log_probs, labels = [], []
+    for path, label in clips:
+        if label not in label_ids:
+            print(f"Skipping {path}: unknown label '{label}'")
+            continue
+        probs = processor.predict_emotion(processor.load_audio(path), return_probs=True)
+        log_probs.append([np.log(max(probs[processor.id2label[i]], 1e-12)) for i in range(len(label_ids))])
+        labels.append(label_ids[label])
+
+    if not labels:
+        print("No usable clips")
+        return 1
+
+    temperature = fit_temperature(log_probs, labels)
+    report = {
+        "emotion_temperature": round(temperature, 4),
+        "samples": len(labels),
+        "nll_uncalibrated": round(temperature_nll(log_probs, labels, 1.0), 4),
+        "nll_calibrated": round(temperature_nll(log_probs, labels, temperature), 4)
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"T = {temperature:.3f} (NLL {report['nll_uncalibrated']} -> {report['nll_calibrated']}) written to {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
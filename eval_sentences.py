@@ -0,0 +1,19 @@
+"""
+Fixed Japanese sentences shared by the benchmark and the backend parity check.
+"""
+
+# Covers the four labels, plus neutral everyday phrases
+PARITY_SENTENCES = [
+    "今日はとても楽しかったです。",
+    "ありがとう、本当に嬉しいです。",
+    "最高の一日でした！",
+    "もう何もしたくない。",
+    "とても悲しい知らせを聞きました。",
+    "一人で寂しいです。",
+    "ふざけるな、いい加減にしろ。",
+    "本当に腹が立つ。",
+    "なんでこんなことをするんだ！",
+    "明日は会議があります。",
+    "駅まで歩いて十分です。",
+    "おはようございます。",
+]
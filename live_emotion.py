@@ -0,0 +1,168 @@
+import threading
+
+import numpy as np
+
+from audio_utils import SAMPLE_RATE, detect_speech
+
+class RingBuffer:
+    """
+    Fixed-size float32 ring buffer holding the most recent `capacity` samples.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._write = 0
+        self.filled = 0
+        self.total_written = 0
+
+    def write(self, samples):
+        samples = np.asarray(samples, dtype=np.float32)
+        if len(samples) >= self.capacity:
+            samples = samples[-self.capacity:]
+
+        end = self._write + len(samples)
+        if end <= self.capacity:
+            self._data[self._write:end] = samples
+        else:
+            split = self.capacity - self._write
+            self._data[self._write:] = samples[:split]
+            self._data[:end - self.capacity] = samples[split:]
+
+        self._write = end % self.capacity
+        self.filled = min(self.capacity, self.filled + len(samples))
+        self.total_written += len(samples)
+
+    def latest(self, count):
+        """
+        Returns a contiguous copy of the last `count` samples (fewer if not yet filled).
+        """
+        count = min(count, self.filled)
+        start = (self._write - count) % self.capacity
+        if start + count <= self.capacity:
+            return self._data[start:start + count].copy()
+        return np.concatenate([self._data[start:], self._data[:self._write]])
+
+class LiveEmotionTracker:
+    """
+    Rolling-window emotion tracking for a live audio stream.
+
+    Frames are pushed as they arrive (any thread); update() runs the emotion
+    model on the last `window` seconds every `cadence` seconds of new audio and
+    smooths the probabilities with an exponential moving average. The tracked
+    label only switches after the smoothed top label has differed from it for
+    `hold` consecutive updates, so the recommendation doesn't flip on one noisy window.
+
+    Audio is buffered at the rate it arrives in; each inference window is
+    resampled to 16 kHz as a whole, so small frames (e.g. 20 ms WebRTC frames)
+    don't each get their own filter edges.
+
+    `predict_probs` takes a 16 kHz float32 waveform and returns { label: probability },
+    e.g. `lambda y: processor.predict_emotion(y, return_probs=True)`.
+    """
+
+    def __init__(self, predict_probs, window=3.0, cadence=1.0, smoothing=0.6, hold=2,
+                 min_window=1.0, skip_silence=True):
+        self.predict_probs = predict_probs
+        self.window_seconds = window
+        self.cadence_seconds = cadence
+        self.min_window_seconds = min_window
+        self.smoothing = smoothing
+        self.hold = hold
+        self.skip_silence = skip_silence
+
+        self.sample_rate = None
+        self.buffer = None
+        self._set_rate(SAMPLE_RATE)
+
+        self.smoothed = None
+        self.label = None
+        self.updates = 0
+        self._candidate = None
+        self._candidate_count = 0
+        self._lock = threading.Lock()
+
+    def _set_rate(self, sample_rate):
+        # Window sizes are in samples at the incoming rate; a rate change starts a fresh buffer
+        self.sample_rate = int(sample_rate)
+        self.window = int(self.window_seconds * self.sample_rate)
+        self.cadence = int(self.cadence_seconds * self.sample_rate)
+        self.min_window = int(self.min_window_seconds * self.sample_rate)
+        self.buffer = RingBuffer(self.window)
+        self._last_inference = 0
+
+    def push(self, samples, sample_rate=SAMPLE_RATE):
+        """
+        Appends mono samples at `sample_rate`.
+        """
+        with self._lock:
+            if sample_rate != self.sample_rate:
+                self._set_rate(sample_rate)
+            self.buffer.write(samples)
+
+    def due(self):
+        with self._lock:
+            return (self.buffer.filled >= self.min_window
+                    and self.buffer.total_written - self._last_inference >= self.cadence)
+
+    def update(self):
+        """
+        Runs one inference if enough new audio has arrived.
+        Returns True if the tracked label changed, False otherwise.
+        """
+        if not self.due():
+            return False
+
+        with self._lock:
+            waveform = self.buffer.latest(self.window)
+            sample_rate = self.sample_rate
+            self._last_inference = self.buffer.total_written
+
+        if sample_rate != SAMPLE_RATE:
+            waveform = resample_to_16k(waveform, sample_rate)
+
+        if self.skip_silence and not detect_speech(waveform):
+            return False
+
+        probs = self.predict_probs(waveform)
+        self.updates += 1
+
+        if self.smoothed is None:
+            self.smoothed = dict(probs)
+        else:
+            self.smoothed = {
+                label: self.smoothing * self.smoothed.get(label, 0.0) + (1 - self.smoothing) * p
+                for label, p in probs.items()
+            }
+
+        top = max(self.smoothed, key=self.smoothed.get)
+        if self.label is None:
+            self.label = top
+            return True
+        if top == self.label:
+            self._candidate, self._candidate_count = None, 0
+            return False
+
+        if top == self._candidate:
+            self._candidate_count += 1
+        else:
+            self._candidate, self._candidate_count = top, 1
+        if self._candidate_count >= self.hold:
+            self.label = top
+            self._candidate, self._candidate_count = None, 0
+            return True
+        return False
+
+    def feed(self, samples, sample_rate=SAMPLE_RATE):
+        """
+        push() followed by update().
+        """
+        self.push(samples, sample_rate)
+        return self.update()
+
+def resample_to_16k(samples, sample_rate):
+    from math import gcd
+    from scipy.signal import resample_poly
+
+    divisor = gcd(int(sample_rate), SAMPLE_RATE)
+    return resample_poly(samples, SAMPLE_RATE // divisor, int(sample_rate) // divisor).astype(np.float32)
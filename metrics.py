@@ -0,0 +1,253 @@
+"""
+In-process instrumentation: timing spans with sampled peak-RSS deltas, per-stage
+histograms (p50/p95/p99), Prometheus / JSON export and size-bounded
+structured logging.
+"""
+import os
+import json
+import time
+import logging
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError: # Windows
+    resource = None
+
+logger = logging.getLogger("moodvibes")
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+# Longest string kept per field in log events
+MAX_FIELD_CHARS = 200
+
+def peak_rss_bytes():
+    """
+    Peak resident set size of this process so far (0 where unavailable).
+    """
+    if resource is None:
+        return 0
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+def current_rss_bytes():
+    """
+    Current resident set size of this process (0 where unavailable; Linux only).
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+class RssWatch:
+    """
+    Samples the current RSS every `interval` seconds from one background thread
+    while any watch is open, and tracks each open watch's peak. Unlike
+    ru_maxrss, which only rises over the process lifetime, this gives every
+    span its own peak once the models have loaded.
+    """
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self._open = {} # token -> [rss at start, peak rss]
+        self._ids = itertools.count()
+        self._active = threading.Event()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        rss = current_rss_bytes()
+        with self._lock:
+            token = next(self._ids)
+            self._open[token] = [rss, rss]
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="rss-watch", daemon=True)
+                self._thread.start()
+            self._active.set()
+        return token
+
+    def stop(self, token):
+        """
+        Closes a watch and returns its peak RSS above the RSS when it was opened.
+        """
+        rss = current_rss_bytes()
+        with self._lock:
+            baseline, peak = self._open.pop(token)
+        return max(peak, rss) - baseline
+
+    def _run(self):
+        while True:
+            self._active.wait()
+            time.sleep(self.interval)
+            rss = current_rss_bytes()
+            with self._lock:
+                for entry in self._open.values():
+                    entry[1] = max(entry[1], rss)
+                if not self._open:
+                    # Idle until the next start()
+                    self._active.clear()
+
+# Shared by every span, so there is one sampling thread per process
+RSS_WATCH = RssWatch()
+
+class Histogram:
+    """
+    Count, sum and a sliding reservoir of the most recent `size` observations for quantiles.
+    """
+
+    def __init__(self, size=2048):
+        self.count = 0
+        self.total = 0.0
+        self._samples = deque(maxlen=size)
+
+    def observe(self, value):
+        self.count += 1
+        self.total += value
+        self._samples.append(value)
+
+    def quantiles(self, quantiles=QUANTILES):
+        ordered = sorted(self._samples)
+        if not ordered:
+            return {q: 0.0 for q in quantiles}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in quantiles}
+
+class MetricsRegistry:
+    """
+    Per-stage latency and peak-RSS-delta histograms.
+    The RSS delta is the stage's peak RSS above the RSS it started at (0 where unavailable).
+    """
+
+    def __init__(self):
+        self._latency = {}
+        self._rss = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds, rss_delta=0):
+        with self._lock:
+            self._latency.setdefault(stage, Histogram()).observe(seconds)
+            self._rss.setdefault(stage, Histogram()).observe(rss_delta)
+
+    @contextmanager
+    def span(self, stage):
+        """
+        Times the enclosed block and records its peak RSS above the RSS it started at.
+        """
+        token = RSS_WATCH.start()
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start, RSS_WATCH.stop(token))
+
+    def snapshot(self):
+        with self._lock:
+            stages = {}
+            for stage, latency in self._latency.items():
+                rss = self._rss[stage]
+                stages[stage] = {
+                    "count": latency.count,
+                    "sum_seconds": latency.total,
+                    "seconds": {f"p{int(q * 100)}": v for q, v in latency.quantiles().items()},
+                    "peak_rss_delta_bytes": {f"p{int(q * 100)}": v for q, v in rss.quantiles().items()}
+                }
+            return stages
+
+    def export_json(self):
+        return json.dumps({"peak_rss_bytes": peak_rss_bytes(), "stages": self.snapshot()}, indent=2)
+
+    def export_prometheus(self):
+        lines = [
+            "# TYPE moodvibes_peak_rss_bytes gauge",
+            f"moodvibes_peak_rss_bytes {peak_rss_bytes()}",
+            "# TYPE moodvibes_stage_seconds summary",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._latency.items()):
+                for q, value in histogram.quantiles().items():
+                    lines.append(f'moodvibes_stage_seconds{{stage="{stage}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'moodvibes_stage_seconds_sum{{stage="{stage}"}} {histogram.total:.6f}')
+                lines.append(f'moodvibes_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+            lines.append("# TYPE moodvibes_stage_peak_rss_delta_bytes summary")
+            for stage, histogram in sorted(self._rss.items()):
+                for q, value in histogram.quantiles().items():
+                    lines.append(f'moodvibes_stage_peak_rss_delta_bytes{{stage="{stage}",quantile="{q}"}} {value:.0f}')
+                lines.append(f'moodvibes_stage_peak_rss_delta_bytes_sum{{stage="{stage}"}} {histogram.total:.0f}')
+                lines.append(f'moodvibes_stage_peak_rss_delta_bytes_count{{stage="{stage}"}} {histogram.count}')
+        return "\n".join(lines) + "\n"
+
+# Process-wide registry used by audio_utils and spotify_client
+METRICS = MetricsRegistry()
+
+def span(stage):
+    return METRICS.span(stage)
+
+def _bounded(value):
+    if isinstance(value, (list, tuple, set, dict)):
+        # Summarize containers instead of dumping payloads
+        return {"type": type(value).__name__, "len": len(value)}
+    if isinstance(value, (int, float, bool)) or value is None:
+        return value
+    text = str(value)
+    if len(text) > MAX_FIELD_CHARS:
+        return text[:MAX_FIELD_CHARS] + f"...(+{len(text) - MAX_FIELD_CHARS} chars)"
+    return text
+
+def configure_logging(level=None):
+    """
+    Sends "moodvibes" events to stderr at `level` (default: $MOODVIBES_LOG_LEVEL, else INFO).
+    Safe to call repeatedly, e.g. on every Streamlit rerun; only one handler is attached.
+    """
+    level = level or os.getenv("MOODVIBES_LOG_LEVEL", "INFO")
+    logger.setLevel(level.upper() if isinstance(level, str) else level)
+    if not any(getattr(handler, "_moodvibes", False) for handler in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s %(message)s"))
+        handler._moodvibes = True
+        logger.addHandler(handler)
+        # Don't print events twice if the host app also configured the root logger
+        logger.propagate = False
+    return logger
+
+def log_event(event, level=logging.INFO, **fields):
+    """
+    Logs one structured JSON event. Strings are truncated and containers are
+    replaced by their length, so events stay small whatever is passed in.
+    """
+    if not logger.isEnabledFor(level):
+        return
+    record = {"event": event}
+    record.update({key: _bounded(value) for key, value in fields.items()})
+    logger.log(level, json.dumps(record, ensure_ascii=False))
+
+def start_metrics_server(port, registry=METRICS, host="0.0.0.0"):
+    """
+    Serves /metrics (Prometheus text) and /metrics.json from a background thread.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/metrics":
+                body, content_type = registry.export_prometheus(), "text/plain; version=0.0.4"
+            elif self.path == "/metrics.json":
+                body, content_type = registry.export_json(), "application/json"
+            else:
+                self.send_error(404)
+                return
+            payload = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
@@ -0,0 +1,160 @@
+import queue
+import time
+import threading
+from concurrent.futures import Future
+
+class SchedulerBusy(RuntimeError):
+    """
+    Raised by InferenceScheduler.submit() when the request queue is full.
+    """
+
+class InferenceScheduler:
+    """
+    Micro-batching front end for a shared AudioProcessor.
+
+    Callers from any thread (e.g. concurrent Streamlit sessions) submit clips
+    and get a Future back. A worker thread collects requests for up to
+    `max_wait_ms` (or until `max_batch_size` are queued) and runs them through
+    AudioProcessor.analyze_batch(), so the models see batched forward passes
+    from one thread instead of competing per-session calls.
+    With a ProcessPoolProcessor, run `batch_workers` = its num_workers loops
+    so every worker process has a batch to work on.
+    The queue is bounded: when `max_queue` requests are waiting, submit()
+    waits up to `submit_timeout` seconds and then raises SchedulerBusy.
+
+    Streaming requests (stream()) can't be batched, but go through the same
+    admission control: they count towards the queue bound and share
+    `max_concurrent` execution slots (default: one per batch worker) with the
+    batch workers, so at most that many pipelines use the cores at once.
+    """
+
+    def __init__(self, processor, max_batch_size=8, max_wait_ms=20, max_queue=32, submit_timeout=0.0,
+                 max_concurrent=None, batch_workers=1):
+        self.processor = processor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.submit_timeout = submit_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._slots = threading.Semaphore(max_concurrent or batch_workers)
+        self._streams_waiting = 0
+        self._lock = threading.Lock()
+
+        self.batches = 0
+        self.requests = 0
+        self.rejected = 0
+
+        self._workers = [
+            threading.Thread(target=self._run, name=f"inference-scheduler-{i}", daemon=True)
+            for i in range(batch_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    @property
+    def queue_depth(self):
+        return self._queue.qsize() + self._streams_waiting
+
+    def submit(self, audio):
+        """
+        Queues a clip (raw bytes, buffer, path or waveform) for analysis.
+        Returns a Future resolving to the analyze() result.
+        """
+        future = Future()
+
+        # Repeated clips don't need a slot in the batch
+        cached = self.processor.cached_result(audio)
+        if cached is not None:
+            future.set_result(cached)
+            return future
+
+        try:
+            if self.submit_timeout:
+                self._queue.put((audio, future), timeout=self.submit_timeout)
+            else:
+                self._queue.put_nowait((audio, future))
+        except queue.Full:
+            self.rejected += 1
+            raise SchedulerBusy(f"Inference queue is full ({self._queue.maxsize} requests waiting)")
+        return future
+
+    def stream(self, audio):
+        """
+        Runs AudioProcessor.analyze_stream() on a clip once an execution slot is free,
+        yielding its events. Raises SchedulerBusy (on the first iteration) if
+        `max_queue` requests are already waiting.
+        """
+        cached = self.processor.cached_result(audio)
+        if cached is not None:
+            yield "result", cached
+            return
+
+        with self._lock:
+            if self.queue_depth >= self._queue.maxsize:
+                self.rejected += 1
+                raise SchedulerBusy(f"Inference queue is full ({self._queue.maxsize} requests waiting)")
+            self._streams_waiting += 1
+        try:
+            self._slots.acquire()
+        finally:
+            with self._lock:
+                self._streams_waiting -= 1
+
+        try:
+            with self._lock:
+                self.requests += 1
+            yield from self.processor.analyze_stream(audio)
+        finally:
+            self._slots.release()
+
+    def stats(self):
+        return {
+            "queue_depth": self.queue_depth,
+            "requests": self.requests,
+            "batches": self.batches,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "rejected": self.rejected
+        }
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            batch = [(audio, future) for audio, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            with self._lock:
+                self.batches += 1
+                self.requests += len(batch)
+            with self._slots:
+                try:
+                    results = self.processor.analyze_batch([audio for audio, _ in batch])
+                except Exception as e:
+                    if len(batch) == 1:
+                        batch[0][1].set_exception(e)
+                        continue
+                    # One bad clip (e.g. undecodable) shouldn't fail the others
+                    self._run_individually(batch)
+                    continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def _run_individually(self, batch):
+        for audio, future in batch:
+            try:
+                future.set_result(self.processor.analyze_batch([audio])[0])
+            except Exception as e:
+                future.set_exception(e)
@@ -1,22 +1,80 @@
 import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import requests
 import spotipy
+from spotipy.exceptions import SpotifyException
 from spotipy.oauth2 import SpotifyClientCredentials
+from urllib3.util.retry import Retry
 from dotenv import load_dotenv
 
+from metrics import span, log_event
+
 load_dotenv()
 
+# Detected emotion -> Spotify search keyword
+MOOD_MAP = {
+    "neu": "chill",
+    "hap": "happy",
+    "sad": "sad",
+    "ang": "workout"
+}
+
+GENRE_OPTIONS = ['All', 'J-Pop', 'K-Pop', 'Pop', 'Rock', 'Jazz', 'Hip-Hop', 'Lo-Fi', 'Classical', 'Electronic']
+
 class SpotifyClient:
-    def __init__(self):
+    def __init__(self, sp=None, cache_ttl=600, max_connections=10, max_rate_limit_retries=3, max_retry_after=30,
+                 playlist_fanout=1, fanout_timeout=5.0, request_timeout=3.0, tracks_per_playlist=10, max_tracks=10, max_per_artist=2):
         self.sp = None
         self.auth_success = False
-        self.authenticate()
+
+        # Multi-playlist mode: with playlist_fanout > 1, tracks from the top N
+        # playlists are fetched in parallel, merged and ranked
+        self.playlist_fanout = playlist_fanout
+        self.tracks_per_playlist = tracks_per_playlist
+        self.max_tracks = max_tracks
+        self.max_per_artist = max_per_artist
+
+        # Wall-clock deadline (seconds) of a whole fan-out; playlists still
+        # pending (slow, retrying or rate limited) are dropped from the result
+        self.fanout_timeout = fanout_timeout
+        # Timeout (seconds) of each HTTP request to the Web API
+        self.request_timeout = request_timeout
+
+        # HTTP connection pool size and 429 (rate limit) handling
+        self.max_connections = max_connections
+        self.max_rate_limit_retries = max_rate_limit_retries
+        self.max_retry_after = max_retry_after
+        # Requests in flight across all callers (prefetch workers x fan-out threads)
+        # never exceed the pool, so connections are reused instead of discarded
+        self._http_slots = threading.BoundedSemaphore(max_connections)
+
+        # Set once every mood x genre combination has been prefetched
+        self.prefetch_ready = threading.Event()
+
+        # Recommendation cache shared by every session using this client:
+        # (emotion, genre) -> (result, fetched_at)
+        self.cache_ttl = cache_ttl
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = {}
+        self._refreshing = set()
+        self._cache_lock = threading.Lock()
+
+        if sp is not None:
+            # Pre-built client (e.g. a local stub)
+            self.sp = sp
+            self.auth_success = True
+        else:
+            self.authenticate()
 
     def authenticate(self):
         client_id = os.getenv("SPOTIPY_CLIENT_ID")
         client_secret = os.getenv("SPOTIPY_CLIENT_SECRET")
 
         try:
-            self.sp = spotipy.Spotify(
+            self.sp = self._build_spotify(
                 auth_manager=SpotifyClientCredentials(
                     client_id=client_id,
                     client_secret=client_secret
@@ -27,25 +85,152 @@ class SpotifyClient:
             print(f"Authentication Error: {e}")
             self.last_error = str(e)
 
+    def _build_spotify(self, **kwargs):
+        """
+        spotipy client on the pooled session, with `request_timeout` on every HTTP request.
+        """
+        return spotipy.Spotify(requests_session=self._build_session(), requests_timeout=self.request_timeout, **kwargs)
+
+    def _build_session(self):
+        """
+        Connection-pooled HTTP session sized for concurrent prefetch.
+        Server errors are retried by urllib3; 429s are handled in _call() so
+        Retry-After can be honoured with a cap.
+        """
+        session = requests.Session()
+        retry = Retry(
+            total=3,
+            connect=None,
+            read=False,
+            allowed_methods=frozenset(['GET', 'POST']),
+            backoff_factor=0.3,
+            status_forcelist=(500, 502, 503, 504)
+        )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_connections=self.max_connections,
+            pool_maxsize=self.max_connections,
+            max_retries=retry
+        )
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    def _call(self, method, *args, deadline=None, **kwargs):
+        """
+        Calls a spotipy method, backing off on 429 according to Retry-After
+        (or exponentially when the header is missing).
+        With a `deadline` (time.monotonic()), gives up instead of waiting past it
+        for a connection slot or a retry.
+        """
+        for attempt in range(self.max_rate_limit_retries + 1):
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not self._http_slots.acquire(timeout=timeout):
+                raise TimeoutError("no free Spotify connection before the deadline")
+            try:
+                return method(*args, **kwargs)
+            except SpotifyException as e:
+                if e.http_status != 429 or attempt == self.max_rate_limit_retries:
+                    raise
+                retry_after = (e.headers or {}).get("Retry-After")
+                try:
+                    delay = float(retry_after)
+                except (TypeError, ValueError):
+                    delay = 0.5 * (2 ** attempt)
+                delay = min(delay, self.max_retry_after)
+                if deadline is not None and time.monotonic() + delay > deadline:
+                    raise
+            finally:
+                self._http_slots.release()
+            time.sleep(delay)
+
+    def prefetch(self, max_workers=8):
+        """
+        Warms the recommendation cache for every mood x genre combination
+        concurrently (at most `max_workers` requests in flight).
+        Sets `prefetch_ready` when done.
+        """
+        keys = [(emotion, genre) for emotion in MOOD_MAP for genre in GENRE_OPTIONS]
+
+        def warm(key):
+            self._store(key, self._fetch_recommendations(*key))
+
+        try:
+            with ThreadPoolExecutor(max_workers=min(max_workers, self.max_connections)) as executor:
+                list(executor.map(warm, keys))
+        finally:
+            self.prefetch_ready.set()
+
+    def start_prefetch(self, max_workers=8):
+        """
+        Runs prefetch() in a background thread and returns immediately.
+        """
+        thread = threading.Thread(target=self.prefetch, args=(max_workers,), daemon=True)
+        thread.start()
+        return thread
+
+    def is_ready(self, emotion, genre=None):
+        """
+        True if recommendations for this combination can be served from the cache.
+        """
+        with self._cache_lock:
+            return (emotion, genre or "All") in self._cache
+
     def get_recommendations(self, emotion, genre=None):
         """
         Returns either:
             - list of cleaned track dicts: [{ name, artist, url, image }]
             - {"error": "..."}
         Never returns None.
+
+        Results are cached per (emotion, genre) for `cache_ttl` seconds.
+        A stale entry is still served while it is refreshed in the background,
+        so a key that has been seen once never waits on the network again.
         """
+        key = (emotion, genre or "All")
+
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self.cache_hits += 1
+                result, fetched_at = entry
+                if time.monotonic() - fetched_at > self.cache_ttl and key not in self._refreshing:
+                    self._refreshing.add(key)
+                    threading.Thread(target=self._refresh, args=(key,), daemon=True).start()
+                return result
+            self.cache_misses += 1
 
+        result = self._fetch_recommendations(emotion, genre)
+        self._store(key, result)
+        return result
+
+    def cache_stats(self):
+        with self._cache_lock:
+            return {
+                "entries": len(self._cache),
+                "hits": self.cache_hits,
+                "misses": self.cache_misses
+            }
+
+    def _refresh(self, key):
+        try:
+            result = self._fetch_recommendations(*key)
+            self._store(key, result)
+        finally:
+            with self._cache_lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, result):
+        # Errors aren't cached so the next request retries
+        if isinstance(result, dict) and "error" in result:
+            return
+        with self._cache_lock:
+            self._cache[key] = (result, time.monotonic())
+
+    def _fetch_recommendations(self, emotion, genre=None):
         if not self.sp:
             return {"error": "Spotify authentication failed."}
 
-        mood_map = {
-            "neu": "chill",
-            "hap": "happy",
-            "sad": "sad",
-            "ang": "workout"
-        }
-
-        mood_query = mood_map.get(emotion, "top hits")
+        mood_query = MOOD_MAP.get(emotion, "top hits")
         
         # Construct query with genre if provided
         if genre and genre != "All":
@@ -55,62 +240,35 @@ class SpotifyClient:
 
         try:
             # Search playlist (fetch more to avoid None items)
-            results = self.sp.search(q=query, type='playlist', limit=10)
-
-            print("results:", results)
+            with span("spotify.search"):
+                results = self._call(self.sp.search, q=query, type='playlist', limit=10)
 
             raw_playlists = results.get("playlists", {}).get("items") or []
 
             # items に None が混ざるバグ対策
             playlists = [p for p in raw_playlists if isinstance(p, dict)]
 
-            print("filtered playlists:", playlists)
+            log_event("spotify.search", query=query, playlists=len(playlists), dropped=len(raw_playlists) - len(playlists))
 
             if not playlists:
                 return {"error": f"No usable playlist found for mood='{query}'"}
 
-            playlist_id = playlists[0].get("id")
+            if self.playlist_fanout > 1:
+                return self._fetch_fanout(playlists, query)
 
-            print("playlist_id:", playlist_id)
+            playlist_id = playlists[0].get("id")
 
             if not playlist_id:
                 return {"error": "Playlist found but missing valid ID."}
 
             # Fetch tracks
-            playlist_tracks = self.sp.playlist_tracks(playlist_id, limit=10)
-
-            print("playlist_tracks: ", playlist_tracks)
+            playlist_tracks = self._playlist_tracks(playlist_id, limit=10)
 
             items = playlist_tracks.get("items") or []
 
-            cleaned_tracks = []
-
-            print("items: ", items)
-
-            for item in items:
-                if not isinstance(item, dict):
-                    continue
-
-                track = item.get("track")
-                if not isinstance(track, dict):
-                    continue
+            cleaned_tracks = self._clean_tracks(items)
 
-                name = track.get("name")
-                artists = track.get("artists") or []
-                url = (track.get("external_urls") or {}).get("spotify")
-                album = track.get("album") or {}
-                images = album.get("images") or []
-
-                if not name or not artists or not url:
-                    continue
-
-                cleaned_tracks.append({
-                    "name": name,
-                    "artist": artists[0]["name"],
-                    "url": url,
-                    "image": images[0]["url"] if images else None,
-                    "id": track.get("id")
-                })
+            log_event("spotify.playlist_tracks", playlist_id=playlist_id, items=len(items), playable=len(cleaned_tracks))
 
             if not cleaned_tracks:
                 return {"error": f"No playable tracks available for '{query}'"}
@@ -119,3 +277,103 @@ class SpotifyClient:
 
         except Exception as e:
             return {"error": f"Unexpected Spotify error: {str(e)}"}
+
+    def _playlist_tracks(self, playlist_id, limit, deadline=None):
+        with span("spotify.playlist_tracks"):
+            return self._call(self.sp.playlist_tracks, playlist_id, limit=limit, deadline=deadline)
+
+    def _fetch_fanout(self, playlists, query):
+        """
+        Fetches tracks from the top `playlist_fanout` playlists in parallel and
+        returns a merged, deduplicated and ranked list.
+        Each call gets its own threads, so concurrent callers (e.g. prefetch)
+        never queue behind each other's playlists, and the response is built
+        from whatever arrived within `fanout_timeout`. Playlists that fail or
+        miss the deadline are skipped.
+        """
+        playlist_ids = [p.get("id") for p in playlists if p.get("id")][:self.playlist_fanout]
+        if not playlist_ids:
+            return {"error": "Playlist found but missing valid ID."}
+
+        deadline = time.monotonic() + self.fanout_timeout
+        executor = ThreadPoolExecutor(max_workers=len(playlist_ids), thread_name_prefix="playlist")
+        futures = [
+            executor.submit(self._playlist_tracks, playlist_id, limit=self.tracks_per_playlist, deadline=deadline)
+            for playlist_id in playlist_ids
+        ]
+        done, _ = wait(futures, timeout=self.fanout_timeout)
+        # Stragglers finish in the background (bounded by request_timeout) without holding the response
+        executor.shutdown(wait=False)
+
+        track_lists = []
+        for future in futures:
+            if future not in done or future.exception() is not None:
+                continue
+            track_lists.append(self._clean_tracks(future.result().get("items") or []))
+
+        ranked = self._rank_tracks(track_lists)
+        log_event("spotify.fanout", query=query, playlists=len(playlist_ids), answered=len(track_lists), ranked=len(ranked))
+        if not ranked:
+            return {"error": f"No playable tracks available for '{query}'"}
+        return ranked
+
+    def _rank_tracks(self, track_lists):
+        """
+        Merges per-playlist track lists, deduplicating by track id.
+        Tracks that appear in more playlists rank first, then by their best
+        position; at most `max_per_artist` tracks per artist are kept.
+        """
+        merged = {}
+        for playlist_rank, tracks in enumerate(track_lists):
+            for position, track in enumerate(tracks):
+                key = track.get("id") or track["url"]
+                entry = merged.get(key)
+                if entry is None:
+                    merged[key] = {"track": track, "count": 1, "best": (position, playlist_rank)}
+                else:
+                    entry["count"] += 1
+                    entry["best"] = min(entry["best"], (position, playlist_rank))
+
+        ordered = sorted(merged.values(), key=lambda e: (-e["count"], e["best"]))
+
+        ranked = []
+        per_artist = {}
+        for entry in ordered:
+            artist = entry["track"]["artist"]
+            if per_artist.get(artist, 0) >= self.max_per_artist:
+                continue
+            per_artist[artist] = per_artist.get(artist, 0) + 1
+            ranked.append(entry["track"])
+            if len(ranked) >= self.max_tracks:
+                break
+        return ranked
+
+    def _clean_tracks(self, items):
+        cleaned_tracks = []
+
+        for item in items:
+            if not isinstance(item, dict):
+                continue
+
+            track = item.get("track")
+            if not isinstance(track, dict):
+                continue
+
+            name = track.get("name")
+            artists = track.get("artists") or []
+            url = (track.get("external_urls") or {}).get("spotify")
+            album = track.get("album") or {}
+            images = album.get("images") or []
+
+            if not name or not artists or not url:
+                continue
+
+            cleaned_tracks.append({
+                "name": name,
+                "artist": artists[0]["name"],
+                "url": url,
+                "image": images[0]["url"] if images else None,
+                "id": track.get("id")
+            })
+
+        return cleaned_tracks
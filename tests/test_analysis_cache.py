@@ -0,0 +1,113 @@
+import json
+import sqlite3
+
+from audio_utils import AnalysisCache
+
+def result(label, padding=0):
+    return {"emotion": label, "transcription": "x" * padding}
+
+def size(value):
+    return len(json.dumps(value))
+
+class CountingConnection:
+    """
+    Wraps a sqlite3 connection and counts commits.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.commits = 0
+
+    def execute(self, *args):
+        return self.db.execute(*args)
+
+    def executemany(self, *args):
+        return self.db.executemany(*args)
+
+    def commit(self):
+        self.commits += 1
+        self.db.commit()
+
+def test_least_recently_used_entry_is_evicted():
+    cache = AnalysisCache(max_entries=2)
+    cache.put("a", result("hap"))
+    cache.put("b", result("sad"))
+    assert cache.get("a") == result("hap") # "b" is now the oldest
+
+    cache.put("c", result("ang"))
+    assert cache.get("b") is None
+    assert cache.get("a") == result("hap")
+    assert cache.get("c") == result("ang")
+    assert cache.stats()["entries"] == 2
+
+def test_byte_bound():
+    small = result("hap", padding=100)
+    cache = AnalysisCache(max_bytes=2 * size(small) + 10)
+    cache.put("a", small)
+    cache.put("b", result("sad", padding=100))
+    cache.put("c", result("ang", padding=100))
+
+    assert cache.get("a") is None
+    assert cache.stats()["bytes"] <= cache.max_bytes
+    # Values bigger than the whole cache aren't stored at all
+    cache.put("huge", result("neu", padding=cache.max_bytes))
+    assert cache.get("huge") is None
+    assert cache.get("c") is not None
+
+def test_hits_and_misses():
+    cache = AnalysisCache()
+    cache.put("a", result("hap"))
+    cache.get("a")
+    cache.get("missing")
+    # A pre-check (e.g. the scheduler's) doesn't count the same miss twice
+    cache.get("missing", count_miss=False)
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_entries_survive_a_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    AnalysisCache(path=path).put("a", result("hap"))
+
+    reopened = AnalysisCache(path=path)
+    assert reopened.stats()["entries"] == 0
+    assert reopened.get("a") == result("hap")
+    # Promoted into memory on the first hit
+    assert reopened.stats()["entries"] == 1
+
+def test_hits_dont_commit(tmp_path):
+    cache = AnalysisCache(path=str(tmp_path / "cache.sqlite"), touch_batch=10)
+    for i in range(10):
+        cache.put(f"k{i}", result("hap"))
+    cache._db = CountingConnection(cache._db)
+
+    for _ in range(3):
+        for i in range(9):
+            assert cache.get(f"k{i}") is not None
+    assert cache._db.commits == 0
+    # Access times of touch_batch distinct keys are written in one batch
+    cache.get("k9")
+    assert cache._db.commits == 1
+
+def test_disk_eviction_follows_access_order(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = AnalysisCache(max_entries=2, path=path)
+    cache.put("a", result("hap"))
+    cache.put("b", result("sad"))
+    # Pending (not yet written) access time of "a" is applied before the next put evicts
+    cache.get("a")
+    cache.put("c", result("ang"))
+
+    keys = {row[0] for row in sqlite3.connect(path).execute("SELECT key FROM analysis_cache")}
+    assert keys == {"a", "c"}
+
+def test_flush_writes_access_times(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    cache = AnalysisCache(path=path)
+    cache.put("a", result("hap"))
+    before = sqlite3.connect(path).execute("SELECT last_access FROM analysis_cache").fetchone()[0]
+
+    cache.get("a")
+    cache.flush()
+    after = sqlite3.connect(path).execute("SELECT last_access FROM analysis_cache").fetchone()[0]
+    assert after >= before
+    assert not cache._touched
@@ -0,0 +1,90 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+import audio_utils
+from audio_utils import AdaptiveAsrPolicy, AudioProcessor, AsrTier, SAMPLE_RATE
+
+TIER = AsrTier("only", "tiny", 1, cost=1.0)
+
+class SharedWhisper:
+    """
+    Stand-in for WhisperModel whose clips take `solo` seconds each alone and
+    proportionally longer while others run, like requests sharing CPU cores.
+    """
+
+    def __init__(self, solo=0.2, duration=1.0):
+        self.solo = solo
+        self.duration = duration
+        self.running = 0
+        self._lock = threading.Lock()
+
+    def transcribe(self, audio, beam_size=None, language=None):
+        with self._lock:
+            self.running += 1
+        try:
+            work = 0.0
+            while work < self.solo:
+                time.sleep(0.005)
+                work += 0.005 / self.running
+        finally:
+            with self._lock:
+                self.running -= 1
+        segments = [SimpleNamespace(start=0.0, end=self.duration, text="テスト")]
+        return segments, SimpleNamespace(duration=self.duration)
+
+def make_processor(policy, model):
+    # Only what transcribe_stream() and select_asr_tier() touch; no real models load
+    processor = AudioProcessor.__new__(AudioProcessor)
+    processor.asr_policy = policy
+    processor.asr_model = model
+    processor.asr_models = {TIER.model_size: model}
+    processor.asr_in_flight = 0
+    processor.queue_depth_source = None
+    processor._asr_lock = threading.Lock()
+    processor._asr_active = 0
+    processor._asr_clock = processor._asr_clock_at = 0.0
+    processor._loaded = {"asr": threading.Event()}
+    processor._loaded["asr"].set()
+    processor.load_errors = {}
+    return processor
+
+def test_concurrent_requests_learn_the_solo_cost():
+    policy = AdaptiveAsrPolicy(tiers=(TIER,), smoothing=0.0)
+    model = SharedWhisper(solo=0.2)
+    processor = make_processor(policy, model)
+    barrier = threading.Barrier(2)
+
+    def run():
+        barrier.wait()
+        processor.transcribe(np.zeros(SAMPLE_RATE, dtype=np.float32), tier=TIER)
+
+    threads = [threading.Thread(target=run) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Each request took ~0.4s of wall time sharing Whisper, but ~0.2s of that is the other's load
+    assert policy.costs[TIER.name] == pytest.approx(0.2, rel=0.3)
+    # The queue depth is charged once, by estimate()
+    assert policy.estimate(TIER, 1.0, queue_depth=1) == pytest.approx(0.4, rel=0.3)
+
+def test_tier_selection_reads_the_duration_without_decoding(monkeypatch):
+    policy = AdaptiveAsrPolicy(latency_budget=1.0, tiers=(TIER,))
+    processor = make_processor(policy, SharedWhisper())
+    seen = []
+    monkeypatch.setattr(audio_utils, "audio_duration", lambda path: seen.append(path) or 3.0)
+    monkeypatch.setattr(policy, "choose", lambda duration, *args: duration)
+
+    assert processor.select_asr_tier("clip.wav") == 3.0
+    assert seen == ["clip.wav"]
+    assert processor.select_asr_tier(np.zeros(2 * SAMPLE_RATE, dtype=np.float32)) == 2.0
+
+def test_audio_duration_from_the_file_header(tmp_path):
+    soundfile = pytest.importorskip("soundfile")
+    path = tmp_path / "clip.wav"
+    soundfile.write(path, np.zeros(SAMPLE_RATE // 2, dtype=np.float32), SAMPLE_RATE)
+    assert audio_utils.audio_duration(str(path)) == pytest.approx(0.5)
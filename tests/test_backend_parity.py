@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+import backend_parity
+from eval_sentences import PARITY_SENTENCES
+
+# Int8 / ONNX against eager fp32. Needs the models (torch, transformers, faster-whisper and,
+# for onnx, optimum[onnxruntime]); skipped otherwise. Set MOODVIBES_PARITY_CLIPS to a
+# directory of real speech clips for a meaningful audio check.
+MIN_AGREEMENT = 0.9
+MAX_PROB_DIFF = 0.1
+
+@pytest.fixture(scope="module")
+def clips():
+    directory = os.getenv("MOODVIBES_PARITY_CLIPS")
+    return backend_parity.load_parity_clips(directory) if directory else backend_parity.make_parity_clips()
+
+def run_or_skip(backend, clips):
+    pytest.importorskip("torch")
+    pytest.importorskip("transformers")
+    pytest.importorskip("faster_whisper")
+    try:
+        result = backend_parity.run_backend(backend, clips, PARITY_SENTENCES)
+    except RuntimeError as e:
+        pytest.skip(f"{backend} models unavailable: {e}")
+    if result["load_errors"]:
+        pytest.skip(f"{backend} models unavailable: {result['load_errors']}")
+    return result
+
+@pytest.fixture(scope="module")
+def reference(clips):
+    return run_or_skip("eager", clips)
+
+@pytest.mark.parametrize("backend", ["int8", "onnx"])
+def test_backend_matches_eager(backend, clips, reference):
+    candidate = run_or_skip(backend, clips)
+    results = backend_parity.compare(reference, candidate)
+
+    for branch, r in results.items():
+        assert r["agreement"] >= MIN_AGREEMENT, f"{branch} label agreement {r['agreement']:.0%}"
+        assert r["max_prob_diff"] <= MAX_PROB_DIFF, f"{branch} probabilities moved by {r['max_prob_diff']:.3f}"
+
+def test_probability_comparison():
+    reference = [{"hap": 0.7, "sad": 0.3}, {"hap": 0.5, "sad": 0.5}]
+    assert backend_parity.max_prob_diff(reference, reference) == 0.0
+    assert backend_parity.mean_kl(reference, reference) == pytest.approx(0.0, abs=1e-6)
+
+    # Same labels, drifted probabilities: agreement alone wouldn't notice
+    drifted = [{"hap": 0.55, "sad": 0.45}, {"hap": 0.5, "sad": 0.5}]
+    assert backend_parity.max_prob_diff(reference, drifted) == pytest.approx(0.15)
+    assert backend_parity.mean_kl(reference, drifted) > 0.0
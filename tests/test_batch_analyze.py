@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+
+from batch_analyze import BatchAnalyzer, load_done
+
+class FakeProcessor:
+    """
+    Decodes "*.bad" paths to an empty waveform that makes analyze_batch() raise.
+    """
+
+    def __init__(self, unreadable=()):
+        self.unreadable = set(unreadable)
+        self.batches = []
+
+    def load_audio(self, path):
+        if path in self.unreadable:
+            raise ValueError("cannot decode")
+        return np.zeros(0 if path.endswith(".bad") else 160, dtype=np.float32)
+
+    def analyze_batch(self, waveforms, stage_seconds=None):
+        self.batches.append(len(waveforms))
+        if any(len(waveform) == 0 for waveform in waveforms):
+            raise RuntimeError("empty waveform")
+        return [{"emotion": "neu"} for _ in waveforms]
+
+def read_records(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+def test_bad_clip_only_fails_itself(tmp_path):
+    output = tmp_path / "results.jsonl"
+    processor = FakeProcessor()
+    analyzer = BatchAnalyzer(processor, batch_size=3)
+
+    analyzer.run(["a.wav", "b.bad", "c.wav", "d.wav"], str(output))
+
+    records = {record["path"]: record for record in read_records(output)}
+    assert records["a.wav"]["emotion"] == "neu"
+    assert records["c.wav"]["emotion"] == "neu"
+    assert records["d.wav"]["emotion"] == "neu"
+    assert "empty waveform" in records["b.bad"]["error"]
+    assert analyzer.errors == 1
+    # First batch failed as a whole and was retried file by file
+    assert processor.batches == [3, 1, 1, 1, 1]
+
+def test_resume_retries_errors_without_duplicating_records(tmp_path):
+    output = tmp_path / "results.jsonl"
+    BatchAnalyzer(FakeProcessor(unreadable={"b.wav"}), batch_size=2).run(["a.wav", "b.wav"], str(output))
+    with open(output, "a", encoding="utf-8") as f:
+        f.write('{"path": "c.wav", "emo') # interrupted mid-write
+
+    done = load_done(str(output))
+    assert done == {"a.wav"}
+    BatchAnalyzer(FakeProcessor(), batch_size=2).run(
+        [path for path in ["a.wav", "b.wav", "c.wav"] if path not in done], str(output)
+    )
+
+    records = read_records(output)
+    assert sorted(record["path"] for record in records) == ["a.wav", "b.wav", "c.wav"]
+    assert not any("error" in record for record in records)
@@ -0,0 +1,32 @@
+import time
+
+import numpy as np
+import pytest
+
+import metrics
+from benchmark import RssSampler, make_clip, summarize
+
+def test_clips_are_deterministic():
+    for kind in ("tone", "noise", "silence", "mixture"):
+        np.testing.assert_array_equal(make_clip(kind, 1.5, seed=3), make_clip(kind, 1.5, seed=3))
+    assert not np.array_equal(make_clip("noise", 1.0, seed=0), make_clip("noise", 1.0, seed=1))
+
+def test_summarize():
+    summary = summarize([0.1, 0.2, 0.3, 0.4], work=2.0)
+    assert summary["count"] == 4
+    assert summary["p50_ms"] == pytest.approx(250.0)
+    assert summary["max_ms"] == pytest.approx(400.0)
+    # 4 calls x 2 s of audio in 1 s of wall time
+    assert summary["work_per_second"] == pytest.approx(8.0)
+
+def test_rss_sampler_sees_peaks_below_the_process_high_water_mark():
+    if not metrics.current_rss_bytes():
+        pytest.skip("current RSS is only readable on Linux")
+    # Raise ru_maxrss first: a monotonic peak delta would then read 0 for the smaller case below
+    high = np.ones(40_000_000)
+    del high
+    with RssSampler() as rss:
+        transient = np.ones(10_000_000)
+        time.sleep(0.05)
+        del transient
+    assert rss.peak_delta > 40_000_000
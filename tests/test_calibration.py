@@ -0,0 +1,33 @@
+import json
+
+import numpy as np
+
+from audio_utils import fit_temperature, load_calibration, temperature_nll
+
+def sample_labels(logits, temperature, seed=0):
+    rng = np.random.default_rng(seed)
+    scaled = logits / temperature
+    probs = np.exp(scaled - scaled.max(axis=1, keepdims=True))
+    probs /= probs.sum(axis=1, keepdims=True)
+    return np.array([rng.choice(len(row), p=row) for row in probs])
+
+def test_fit_recovers_the_generating_temperature():
+    logits = np.random.default_rng(1).normal(0, 4, (4000, 4))
+    for true_temperature in (0.5, 2.5):
+        labels = sample_labels(logits, true_temperature)
+        fitted = fit_temperature(logits, labels)
+        assert abs(fitted - true_temperature) / true_temperature < 0.1
+        assert temperature_nll(logits, labels, fitted) <= temperature_nll(logits, labels, 1.0)
+
+def test_log_probabilities_fit_like_logits():
+    logits = np.random.default_rng(2).normal(0, 3, (500, 4))
+    labels = sample_labels(logits, 2.0)
+    log_probs = logits - np.log(np.exp(logits).sum(axis=1, keepdims=True))
+    assert np.isclose(fit_temperature(logits, labels), fit_temperature(log_probs, labels), rtol=1e-4)
+
+def test_load_calibration(tmp_path):
+    assert load_calibration(None) == 1.0
+    assert load_calibration(str(tmp_path / "missing.json")) == 1.0
+    path = tmp_path / "calibration.json"
+    path.write_text(json.dumps({"emotion_temperature": 1.7}))
+    assert load_calibration(str(path)) == 1.7
@@ -0,0 +1,105 @@
+import numpy as np
+import pytest
+
+from audio_utils import SAMPLE_RATE
+from live_emotion import LiveEmotionTracker, RingBuffer
+
+def voiced(seconds, sample_rate=SAMPLE_RATE):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    phase = 2 * np.pi * np.cumsum(150.0 * (1 + 0.1 * np.sin(2 * np.pi * 0.5 * t))) / sample_rate
+    return (0.1 * sum(np.sin(k * phase) / k for k in range(1, 10))).astype(np.float32)
+
+def frames(waveform, frame_ms=20, sample_rate=SAMPLE_RATE):
+    size = int(sample_rate * frame_ms / 1000)
+    return [waveform[i:i + size] for i in range(0, len(waveform), size)]
+
+class ScriptedModel:
+    """
+    Returns the next probability dict from `script` on every call and records the inputs.
+    """
+
+    def __init__(self, script=None):
+        self.script = list(script or [])
+        self.inputs = []
+
+    def __call__(self, waveform):
+        self.inputs.append(waveform)
+        label = self.script.pop(0) if self.script else "neu"
+        return {name: (1.0 if name == label else 0.0) for name in ("neu", "hap", "sad", "ang")}
+
+def test_ring_buffer_wraps_around():
+    buffer = RingBuffer(5)
+    buffer.write([1, 2, 3])
+    buffer.write([4, 5, 6, 7])
+    assert buffer.filled == 5 and buffer.total_written == 7
+    assert buffer.latest(5).tolist() == [3, 4, 5, 6, 7]
+    assert buffer.latest(2).tolist() == [6, 7]
+
+    buffer.write(np.arange(10, 22))
+    assert buffer.latest(10).tolist() == [17, 18, 19, 20, 21]
+
+def test_ring_buffer_returns_copies():
+    buffer = RingBuffer(4)
+    buffer.write([1, 2])
+    latest = buffer.latest(2)
+    buffer.write([9, 9, 9, 9])
+    assert latest.tolist() == [1, 2]
+
+def test_inference_runs_once_per_cadence():
+    model = ScriptedModel()
+    tracker = LiveEmotionTracker(model, window=3.0, cadence=1.0, min_window=1.0)
+    audio = voiced(4.0)
+
+    calls = []
+    for frame in frames(audio):
+        tracker.feed(frame)
+        calls.append(len(model.inputs))
+
+    # Nothing before 1 s of audio, then one inference per further second
+    assert len(model.inputs) == 4
+    # 20 ms frames: the 50th frame completes the first second
+    assert calls[48] == 0
+    assert calls[49] == 1
+    assert calls[98] == 1
+    assert calls[99] == 2
+    assert max(len(waveform) for waveform in model.inputs) == 3 * SAMPLE_RATE
+
+def test_label_switch_needs_hold_consecutive_updates():
+    model = ScriptedModel(["hap", "sad", "hap", "sad", "sad", "sad"])
+    tracker = LiveEmotionTracker(model, window=1.0, cadence=1.0, smoothing=0.0, hold=2)
+
+    changes = []
+    for second in range(6):
+        tracker.push(voiced(1.0))
+        changes.append(tracker.update())
+        if second == 0:
+            assert tracker.label == "hap"
+
+    # A single "sad" window doesn't switch; two in a row do
+    assert changes == [True, False, False, False, True, False]
+    assert tracker.label == "sad"
+
+def test_silence_is_skipped():
+    model = ScriptedModel()
+    tracker = LiveEmotionTracker(model, window=1.0, cadence=1.0)
+
+    tracker.push(np.zeros(SAMPLE_RATE, dtype=np.float32))
+    assert tracker.update() is False
+    assert model.inputs == []
+    # The silent window still used up its cadence
+    assert not tracker.due()
+
+    tracker.push(voiced(1.0))
+    assert tracker.update() is True
+    assert len(model.inputs) == 1
+
+def test_other_rates_are_resampled_per_window():
+    pytest.importorskip("scipy")
+    model = ScriptedModel()
+    tracker = LiveEmotionTracker(model, window=2.0, cadence=1.0)
+
+    for frame in frames(voiced(2.0, 48000), sample_rate=48000):
+        tracker.feed(frame, 48000)
+
+    assert tracker.sample_rate == 48000
+    assert [len(waveform) for waveform in model.inputs] == [SAMPLE_RATE, 2 * SAMPLE_RATE]
@@ -0,0 +1,51 @@
+import json
+import time
+import logging
+
+import pytest
+
+import metrics
+from metrics import configure_logging, log_event
+
+@pytest.fixture
+def clean_logger():
+    logger = logging.getLogger("moodvibes")
+    saved = logger.handlers[:], logger.level, logger.propagate
+    logger.handlers = []
+    yield logger
+    logger.handlers, level, logger.propagate = saved
+    logger.setLevel(level)
+
+def test_log_level_from_environment(monkeypatch, clean_logger):
+    monkeypatch.setenv("MOODVIBES_LOG_LEVEL", "warning")
+    configure_logging()
+    assert clean_logger.level == logging.WARNING
+    assert not clean_logger.isEnabledFor(logging.INFO)
+
+def test_repeated_calls_attach_one_handler(clean_logger):
+    configure_logging("DEBUG")
+    configure_logging("DEBUG")
+    assert len(clean_logger.handlers) == 1
+
+def test_events_reach_the_handler(clean_logger, capsys):
+    configure_logging("INFO")
+    log_event("test.event", text="x" * (metrics.MAX_FIELD_CHARS + 5), items=[1, 2])
+    line = capsys.readouterr().err.strip().splitlines()[-1]
+    record = json.loads(line[line.index("{"):])
+    assert record["event"] == "test.event"
+    assert record["items"] == {"type": "list", "len": 2}
+    assert record["text"].endswith("(+5 chars)")
+
+def test_span_records_its_own_peak_rss():
+    np = pytest.importorskip("numpy")
+    if not metrics.current_rss_bytes():
+        pytest.skip("current RSS is only readable on Linux")
+    registry = metrics.MetricsRegistry()
+    # Raise ru_maxrss first: a delta of ru_maxrss would then read 0 for the smaller stage
+    high = np.ones(40_000_000)
+    del high
+    with registry.span("stage"):
+        transient = np.ones(10_000_000)
+        time.sleep(0.05)
+        del transient
+    assert registry.snapshot()["stage"]["peak_rss_delta_bytes"]["p50"] > 40_000_000
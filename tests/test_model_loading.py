@@ -0,0 +1,12 @@
+import sys
+
+from audio_utils import AudioProcessor, MODEL_KEYS
+
+def test_missing_torch_fails_every_model_instead_of_hanging(monkeypatch):
+    # None in sys.modules makes `import torch` raise ImportError
+    monkeypatch.setitem(sys.modules, "torch", None)
+    processor = AudioProcessor(background=True)
+
+    assert processor.wait_ready(timeout=5) is False
+    assert set(processor.load_errors) == set(MODEL_KEYS)
+    assert processor.readiness() == {name: False for name in MODEL_KEYS}
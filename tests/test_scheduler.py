@@ -0,0 +1,93 @@
+import time
+import threading
+
+import pytest
+
+from scheduler import InferenceScheduler, SchedulerBusy
+
+class FakeProcessor:
+    """
+    Records how many pipelines run at once; each takes `delay` seconds.
+    """
+
+    def __init__(self, delay=0.1):
+        self.delay = delay
+        self.running = 0
+        self.max_running = 0
+        self._lock = threading.Lock()
+
+    def cached_result(self, audio):
+        return None
+
+    def _enter(self):
+        with self._lock:
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+
+    def _exit(self):
+        with self._lock:
+            self.running -= 1
+
+    def analyze_batch(self, audios):
+        self._enter()
+        time.sleep(self.delay)
+        self._exit()
+        return [{"audio": audio} for audio in audios]
+
+    def analyze_stream(self, audio):
+        self._enter()
+        try:
+            yield "segment", {"text": audio}
+            time.sleep(self.delay)
+            yield "result", {"audio": audio}
+        finally:
+            self._exit()
+
+def consume(stream):
+    return [event for event, _ in stream]
+
+def test_streams_and_batches_share_execution_slots():
+    processor = FakeProcessor()
+    scheduler = InferenceScheduler(processor, max_wait_ms=1)
+
+    threads = [threading.Thread(target=consume, args=(scheduler.stream(f"s{i}"),)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    futures = [scheduler.submit(f"b{i}") for i in range(3)]
+    for thread in threads:
+        thread.join()
+
+    assert [future.result(timeout=5)["audio"] for future in futures] == ["b0", "b1", "b2"]
+    assert processor.max_running == 1
+
+def test_stream_yields_processor_events():
+    scheduler = InferenceScheduler(FakeProcessor(delay=0))
+    assert consume(scheduler.stream("a")) == ["segment", "result"]
+
+def test_stream_rejected_when_queue_full():
+    processor = FakeProcessor(delay=0.3)
+    scheduler = InferenceScheduler(processor, max_queue=1)
+
+    running = scheduler.stream("a")
+    next(running) # holds the only execution slot
+    waiting = threading.Thread(target=consume, args=(scheduler.stream("b"),))
+    waiting.start()
+    time.sleep(0.05)
+
+    with pytest.raises(SchedulerBusy):
+        consume(scheduler.stream("c"))
+    assert scheduler.stats()["rejected"] == 1
+
+    consume(running)
+    waiting.join(timeout=5)
+    assert scheduler.queue_depth == 0
+
+def test_one_batch_in_flight_per_batch_worker():
+    # e.g. one loop per ProcessPoolProcessor worker
+    processor = FakeProcessor(delay=0.2)
+    scheduler = InferenceScheduler(processor, max_batch_size=1, max_wait_ms=1, batch_workers=3)
+
+    futures = [scheduler.submit(f"b{i}") for i in range(3)]
+    assert sorted(future.result(timeout=5)["audio"] for future in futures) == ["b0", "b1", "b2"]
+    assert processor.max_running == 3
+    assert scheduler.stats()["batches"] == 3
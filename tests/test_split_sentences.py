@@ -0,0 +1,17 @@
+from audio_utils import SENTENCE_ENDINGS, split_sentences
+
+def test_english_sentences_split_on_periods():
+    assert split_sentences("Hello there. How are you?") == ["Hello there.", "How are you?"]
+
+def test_decimals_and_ellipses_stay_intact():
+    assert split_sentences("It costs 3.5 dollars. OK!") == ["It costs 3.5 dollars.", "OK!"]
+    assert split_sentences("Wait... what?") == ["Wait...", "what?"]
+
+def test_japanese_splits_on_punctuation_and_segment_spaces():
+    assert split_sentences("一文目です。二文目です！") == ["一文目です。", "二文目です！"]
+    assert split_sentences("今日は晴れ 明日は雨") == ["今日は晴れ", "明日は雨"]
+
+def test_every_sentence_ending_splits():
+    # Whatever the streaming path treats as a finished sentence is split here too
+    for ending in SENTENCE_ENDINGS:
+        assert split_sentences(f"one{ending} two") == [f"one{ending}", "two"]
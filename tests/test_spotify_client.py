@@ -0,0 +1,223 @@
+import time
+import threading
+from types import SimpleNamespace
+
+import pytest
+import requests
+from spotipy.exceptions import SpotifyException
+
+import spotify_client
+from spotify_client import SpotifyClient
+
+def make_tracks(playlist_id, count=3):
+    return {"items": [
+        {"track": {
+            "id": f"{playlist_id}-{i}",
+            "name": f"Track {i}",
+            "artists": [{"name": f"Artist {i}"}],
+            "external_urls": {"spotify": f"https://open.spotify.com/track/{playlist_id}-{i}"},
+            "album": {"images": []}
+        }}
+        for i in range(count)
+    ]}
+
+class StubSpotify:
+    """
+    Stand-in for spotipy.Spotify with the two endpoints SpotifyClient uses.
+    """
+
+    def __init__(self, playlists=("pl0", "pl1", "pl2"), failures=None, search_gate=None, playlist_delay=0.0, broken=(), hung=()):
+        self.playlists = playlists
+        self.playlist_delay = playlist_delay
+        self.broken = set(broken) # playlist ids whose request times out
+        self.hung = set(hung) # playlist ids whose request blocks until `release` is set
+        self.release = threading.Event()
+        self.failures = list(failures or []) # exceptions raised by the next searches, in order
+        self.search_gate = search_gate
+        self.searches = 0
+        self.playlist_calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def search(self, q, type, limit):
+        with self._lock:
+            self.searches += 1
+            failure = self.failures.pop(0) if self.failures else None
+        if self.search_gate is not None:
+            self.search_gate.wait(5)
+        if failure is not None:
+            raise failure
+        return {"playlists": {"items": [{"id": playlist_id} for playlist_id in self.playlists]}}
+
+    def playlist_tracks(self, playlist_id, limit):
+        with self._lock:
+            self.playlist_calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.playlist_delay:
+                time.sleep(self.playlist_delay)
+            if playlist_id in self.hung:
+                self.release.wait(10)
+            if playlist_id in self.broken:
+                raise requests.exceptions.ReadTimeout("stub timeout")
+            return make_tracks(playlist_id)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+def test_hit_and_miss_counters():
+    client = SpotifyClient(sp=StubSpotify())
+
+    first = client.get_recommendations("hap")
+    second = client.get_recommendations("hap")
+    client.get_recommendations("sad", "Jazz")
+
+    assert isinstance(first, list) and first
+    assert second is first
+    assert client.cache_stats() == {"entries": 2, "hits": 1, "misses": 2}
+    assert client.sp.searches == 2
+
+def test_stale_entry_served_while_one_refresh_runs():
+    gate = threading.Event()
+    stub = StubSpotify()
+    client = SpotifyClient(sp=stub, cache_ttl=60)
+    stale = client.get_recommendations("hap")
+
+    # Age the entry past its TTL and make the refresh block until released
+    key = ("hap", "All")
+    client._cache[key] = (stale, client._cache[key][1] - 120)
+    stub.search_gate = gate
+
+    results = [client.get_recommendations("hap") for _ in range(5)]
+    assert all(result is stale for result in results)
+    # The refresh runs on its own thread; wait for it to reach the (blocked) search
+    deadline = time.monotonic() + 5
+    while stub.searches < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert client.get_recommendations("hap") is stale
+    assert stub.searches == 2 # the initial fetch plus exactly one refresh
+
+    gate.set()
+    deadline = time.monotonic() + 5
+    while client._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not client._refreshing
+    assert client.get_recommendations("hap") is not stale
+    assert stub.searches == 2
+
+def test_errors_are_not_cached():
+    stub = StubSpotify(playlists=())
+    client = SpotifyClient(sp=stub)
+
+    assert "error" in client.get_recommendations("hap")
+    assert "error" in client.get_recommendations("hap")
+    assert stub.searches == 2
+    assert client.cache_stats()["entries"] == 0
+
+    stub.playlists = ("pl0",)
+    assert isinstance(client.get_recommendations("hap"), list)
+    assert client.cache_stats()["entries"] == 1
+
+def test_fanout_merges_playlists_and_skips_failures():
+    stub = StubSpotify(broken={"pl1"})
+    client = SpotifyClient(sp=stub, playlist_fanout=3)
+
+    tracks = client.get_recommendations("hap")
+    assert {track["id"].split("-")[0] for track in tracks} == {"pl0", "pl2"}
+    assert stub.playlist_calls == 3
+
+def test_hung_playlist_is_dropped_at_the_deadline():
+    stub = StubSpotify(hung={"pl1"})
+    client = SpotifyClient(sp=stub, playlist_fanout=3, fanout_timeout=0.3)
+
+    start = time.monotonic()
+    tracks = client.get_recommendations("hap")
+    elapsed = time.monotonic() - start
+    stub.release.set()
+
+    assert elapsed < 1.0
+    assert {track["id"].split("-")[0] for track in tracks} == {"pl0", "pl2"}
+
+def test_rate_limited_playlist_isnt_retried_past_the_deadline(sleeps):
+    class RateLimitedPlaylist(StubSpotify):
+        def playlist_tracks(self, playlist_id, limit):
+            if playlist_id == "pl1":
+                raise rate_limited("30")
+            return super().playlist_tracks(playlist_id, limit)
+
+    client = SpotifyClient(sp=RateLimitedPlaylist(), playlist_fanout=3, fanout_timeout=2.0)
+
+    tracks = client.get_recommendations("hap")
+    assert {track["id"].split("-")[0] for track in tracks} == {"pl0", "pl2"}
+    # A 30 s Retry-After can't fit in a 2 s deadline, so it isn't waited on at all
+    assert sleeps == []
+
+def test_concurrent_callers_share_the_connection_limit():
+    # 8 prefetch workers x 3 playlists each, every playlist slow
+    stub = StubSpotify(playlist_delay=0.05)
+    client = SpotifyClient(sp=stub, playlist_fanout=3, max_connections=4)
+
+    start = time.monotonic()
+    client.prefetch(max_workers=8)
+    elapsed = time.monotonic() - start
+
+    keys = len(spotify_client.MOOD_MAP) * len(spotify_client.GENRE_OPTIONS)
+    assert client.cache_stats()["entries"] == keys
+    assert stub.playlist_calls == 3 * keys
+    assert stub.max_in_flight == 4
+    # 120 playlist requests of 50 ms, 4 at a time
+    assert elapsed < 3.0
+
+def test_request_timeout_applies_to_http_requests():
+    benchmark = pytest.importorskip("benchmark")
+    server = benchmark.StubSpotify(latency=2.0)
+    url = server.start()
+    try:
+        client = SpotifyClient(sp=object(), request_timeout=0.2)
+        client.sp = client._build_spotify(auth="dummy")
+        client.sp.prefix = url
+
+        start = time.monotonic()
+        result = client.get_recommendations("hap")
+        assert "error" in result
+        assert time.monotonic() - start < 1.5
+    finally:
+        server.stop()
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    # Only spotify_client's view of time; other threads (e.g. metrics sampling) keep the real sleep
+    delays = []
+    monkeypatch.setattr(spotify_client, "time", SimpleNamespace(sleep=delays.append, monotonic=time.monotonic))
+    return delays
+
+def rate_limited(retry_after=None):
+    headers = {"Retry-After": retry_after} if retry_after is not None else {}
+    return SpotifyException(429, -1, "rate limited", headers=headers)
+
+def test_call_honours_retry_after(sleeps):
+    stub = StubSpotify(failures=[rate_limited("2"), rate_limited("7")])
+    client = SpotifyClient(sp=stub, max_retry_after=5)
+
+    assert isinstance(client.get_recommendations("hap"), list)
+    # Retry-After is honoured, but capped at max_retry_after
+    assert sleeps == [2.0, 5]
+    assert stub.searches == 3
+
+def test_call_backs_off_without_retry_after(sleeps):
+    stub = StubSpotify(failures=[rate_limited(), rate_limited()])
+    client = SpotifyClient(sp=stub)
+
+    assert isinstance(client.get_recommendations("hap"), list)
+    assert sleeps == [0.5, 1.0]
+
+def test_call_gives_up_after_max_retries(sleeps):
+    stub = StubSpotify(failures=[rate_limited("1")] * 3)
+    client = SpotifyClient(sp=stub, max_rate_limit_retries=2)
+
+    result = client.get_recommendations("hap")
+    assert "error" in result
+    assert sleeps == [1.0, 1.0]
+    assert client.cache_stats()["entries"] == 0
@@ -0,0 +1,51 @@
+import numpy as np
+
+from audio_utils import SAMPLE_RATE, AudioProcessor, FusionPolicy, detect_speech, trim_silence
+
+def voiced(seconds, amplitude=0.1):
+    # Harmonic signal with a pitch contour, roughly like voiced speech
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    pitch = 150.0 * (1 + 0.1 * np.sin(2 * np.pi * 0.5 * t))
+    phase = 2 * np.pi * np.cumsum(pitch) / SAMPLE_RATE
+    return (amplitude * sum(np.sin(k * phase) / k for k in range(1, 10))).astype(np.float32)
+
+def noise(seconds, sigma=0.01, seed=0):
+    return np.random.default_rng(seed).normal(0, sigma, int(seconds * SAMPLE_RATE)).astype(np.float32)
+
+def test_silence_has_no_speech():
+    assert detect_speech(np.zeros(3 * SAMPLE_RATE, dtype=np.float32)) == []
+
+def test_steady_background_noise_is_not_speech():
+    for sigma in (0.01, 0.1):
+        trimmed, stats = trim_silence(noise(3, sigma))
+        assert not stats.speech_detected
+        assert len(trimmed) == 0
+
+def test_voiced_signal_is_kept_whole():
+    waveform = voiced(3)
+    trimmed, stats = trim_silence(waveform)
+    assert trimmed is waveform
+    assert stats.speech_seconds == 3.0
+
+def test_noise_around_speech_is_dropped():
+    waveform = np.concatenate([noise(2, seed=1), voiced(1) + noise(1, seed=2), noise(2, seed=3)])
+    _, stats = trim_silence(waveform)
+    assert len(stats.segments) == 1
+    start, end = stats.segments[0]
+    # The voiced second plus at most the padding on each side
+    assert 1.7 <= start <= 2.0 and 3.0 <= end <= 3.3
+    assert stats.dropped_seconds > 3.4
+
+def test_flatness_check_can_be_disabled():
+    assert detect_speech(noise(3), flatness_threshold=None) != []
+
+def test_silent_result_has_the_same_keys_as_an_analyzed_one():
+    processor = AudioProcessor.__new__(AudioProcessor)
+    processor.fusion_policy = FusionPolicy()
+    processor.asr_policy = None
+    _, vad_stats = trim_silence(np.zeros(SAMPLE_RATE, dtype=np.float32))
+
+    analyzed = processor._build_result("", {"neu": 0.7, "hap": 0.1, "sad": 0.1, "ang": 0.1}, None, vad_stats)
+    silent = processor._silent_result(vad_stats)
+    assert silent.keys() == analyzed.keys()
+    assert silent["audio_probs"] is None
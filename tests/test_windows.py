@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from audio_utils import pool_window_logits, sliding_windows
+
+def test_windows_cover_the_clip_with_the_tail_aligned():
+    spans = sliding_windows(100, 40, 20)
+    assert spans == [(0, 40), (20, 60), (40, 80), (60, 100)]
+
+    # Hop doesn't divide evenly: the last window ends at the clip end, same length
+    spans = sliding_windows(110, 40, 30)
+    assert spans == [(0, 40), (30, 70), (60, 100), (70, 110)]
+    assert all(end - start == 40 for start, end in spans)
+
+def test_short_clip_is_one_window():
+    assert sliding_windows(30, 40, 20) == [(0, 30)]
+    assert sliding_windows(40, 40, 20) == [(0, 40)]
+
+def test_mean_aggregation():
+    logits = np.array([[0.0, 1.5], [0.0, 1.5], [2.5, 0.0]])
+    np.testing.assert_allclose(pool_window_logits(logits, "mean"), logits.mean(axis=0))
+
+def test_attention_follows_the_confident_window():
+    # Two ambiguous windows lean to label 1, one confident window says label 0
+    logits = np.array([[0.0, 1.5], [0.0, 1.5], [2.5, 0.0]])
+    assert np.argmax(pool_window_logits(logits, "mean")) == 1
+    assert np.argmax(pool_window_logits(logits, "attention")) == 0
+
+def test_attention_temperature_sharpens():
+    logits = np.array([[0.0, 1.0], [3.0, 0.0]])
+    soft = pool_window_logits(logits, "attention", temperature=100.0)
+    sharp = pool_window_logits(logits, "attention", temperature=0.1)
+    # A very high temperature is the mean; a low one is the most confident window
+    np.testing.assert_allclose(soft, logits.mean(axis=0), atol=0.02)
+    np.testing.assert_allclose(sharp, logits[1], atol=1e-6)
+
+def test_equal_margins_reduce_to_the_mean():
+    logits = np.array([[1.0, 0.0], [0.0, 1.0]])
+    np.testing.assert_allclose(pool_window_logits(logits, "attention"), [0.5, 0.5])
+
+def test_unknown_aggregation():
+    with pytest.raises(ValueError):
+        pool_window_logits(np.zeros((2, 4)), "max")
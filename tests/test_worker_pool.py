@@ -0,0 +1,114 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from audio_utils import MODEL_KEYS, SAMPLE_RATE
+from worker_pool import ProcessPoolProcessor, WorkerCrashed
+
+class BrokenProcessor:
+    """
+    Fails in its constructor, like a worker whose models can't be imported.
+    """
+
+    def __init__(self, **kwargs):
+        raise ModuleNotFoundError("No module named 'torch'")
+
+def test_worker_that_cant_load_is_given_up_on():
+    pool = ProcessPoolProcessor(num_workers=1, processor_factory=BrokenProcessor, health_interval=0.05, max_restarts=2)
+    try:
+        start = time.monotonic()
+        # Finishes (loaded with errors) instead of waiting forever
+        assert pool.wait_ready(timeout=30) is False
+        assert time.monotonic() - start < 30
+        assert pool.restarts == 2
+        assert "No module named 'torch'" in pool.load_errors["worker-0"]
+        assert pool.readiness() == {name: False for name in MODEL_KEYS}
+        with pytest.raises(RuntimeError, match="could load"):
+            pool.transcribe(np.zeros(16, dtype=np.float32))
+    finally:
+        pool.close()
+
+CRASH, HANG = 42.0, 7.0
+
+class EchoProcessor:
+    """
+    Reports what it received; a waveform starting with CRASH kills the
+    worker, one starting with HANG sleeps for waveform[1] seconds first.
+    """
+
+    def __init__(self, **kwargs):
+        self.model_versions = "echo"
+        self.load_errors = {}
+
+    def readiness(self):
+        return {name: True for name in MODEL_KEYS}
+
+    def transcribe(self, waveform, latency_budget=None):
+        if waveform[0] == CRASH:
+            os._exit(1)
+        if waveform[0] == HANG:
+            time.sleep(float(waveform[1]))
+        return f"{os.getpid()} {waveform.dtype} {len(waveform)} {float(waveform.sum()):.1f}"
+
+    def analyze_batch(self, waveforms):
+        return [{"pid": os.getpid(), "sum": float(waveform.sum())} for waveform in waveforms]
+
+@pytest.fixture
+def make_pool():
+    pools = []
+
+    def make(**kwargs):
+        kwargs = {"num_workers": 1, "processor_factory": EchoProcessor, "health_interval": 0.05, **kwargs}
+        pool = ProcessPoolProcessor(**kwargs)
+        pools.append(pool)
+        assert pool.wait_ready(timeout=30)
+        return pool
+
+    yield make
+    for pool in pools:
+        pool.close()
+
+def test_waveforms_reach_workers_through_shared_memory(make_pool):
+    pool = make_pool(num_workers=2)
+    waveform = np.arange(1000, dtype=np.float64)
+
+    # Converted to float32 on the way, values intact
+    assert pool.transcribe(waveform).split()[1:] == ["float32", "1000", f"{waveform.sum():.1f}"]
+    results = pool.analyze_batch([np.full(10, i, dtype=np.float32) for i in range(4)])
+    assert [result["sum"] for result in results] == [0.0, 10.0, 20.0, 30.0]
+    # The batch was split across both workers
+    assert len({result["pid"] for result in results}) == 2
+    # Parent-owned blocks are unlinked once the results are in
+    assert not pool._futures
+
+def test_crashed_worker_is_restarted(make_pool):
+    pool = make_pool()
+    pid = pool.transcribe(np.zeros(4, dtype=np.float32)).split()[0]
+
+    with pytest.raises(WorkerCrashed):
+        pool.transcribe(np.array([CRASH, 0], dtype=np.float32))
+    assert pool.wait_ready(timeout=30)
+    assert pool.restarts == 1
+    assert pool.transcribe(np.zeros(4, dtype=np.float32)).split()[0] != pid
+
+def test_hung_worker_is_restarted(make_pool):
+    pool = make_pool(request_timeout=0.3, timeout_per_audio_second=0.0)
+
+    start = time.monotonic()
+    with pytest.raises(WorkerCrashed):
+        pool.transcribe(np.array([HANG, 30], dtype=np.float32))
+    assert time.monotonic() - start < 10
+    assert pool.restarts == 1
+
+def test_hang_timeout_scales_with_audio_duration(make_pool):
+    pool = make_pool(request_timeout=0.3, timeout_per_audio_second=0.2)
+
+    # 10 s of audio may take 0.3 + 2.0 s; a short clip only 0.3 s
+    long_clip = np.zeros(10 * SAMPLE_RATE, dtype=np.float32)
+    long_clip[:2] = HANG, 1.0
+    assert pool.transcribe(long_clip)
+    assert pool.restarts == 0
+    with pytest.raises(WorkerCrashed):
+        pool.transcribe(np.array([HANG, 1.0], dtype=np.float32))
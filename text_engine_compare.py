@@ -0,0 +1,72 @@
+"""
+Agreement / latency comparison of the text emotion engines.
+
+Usage:
+    python text_engine_compare.py
+    python text_engine_compare.py --direct-model MilaNLProc/xlm-emo-t
+
+Runs the current translate chain (MarianMT ja->en + English RoBERTa) and the
+direct multilingual classifier on a fixed, labelled Japanese test set and
+prints per-engine accuracy, agreement between the engines and latency.
+Each sentence is classified cold (caches cleared), so latency reflects model cost.
+"""
+import sys
+import time
+import argparse
+
+from audio_utils import AudioProcessor
+
+# (sentence, expected label)
+TEXT_TEST_SET = [
+    ("今日はとても楽しかったです。", "hap"),
+    ("ありがとう、本当に嬉しいです。", "hap"),
+    ("最高の一日でした！", "hap"),
+    ("試験に合格しました！", "hap"),
+    ("友達と会えてうれしい。", "hap"),
+    ("もう何もしたくない。", "sad"),
+    ("とても悲しい知らせを聞きました。", "sad"),
+    ("一人で寂しいです。", "sad"),
+    ("大切な人を失いました。", "sad"),
+    ("夜道が怖くて眠れない。", "sad"),
+    ("ふざけるな、いい加減にしろ。", "ang"),
+    ("本当に腹が立つ。", "ang"),
+    ("なんでこんなことをするんだ！", "ang"),
+    ("約束を破られて怒っています。", "ang"),
+    ("うるさい、黙れ！", "ang"),
+]
+
+def run_engine(text_engine, direct_model):
+    processor = AudioProcessor(text_engine=text_engine, direct_text_model=direct_model)
+    labels = []
+    seconds = []
+    for sentence, _ in TEXT_TEST_SET:
+        processor.translation_cache = type(processor.translation_cache)()
+        processor.text_emotion_cache = type(processor.text_emotion_cache)()
+        start = time.perf_counter()
+        labels.append(processor.predict_text_emotion(sentence))
+        seconds.append(time.perf_counter() - start)
+    return labels, seconds
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the translate and direct text emotion engines.")
+    parser.add_argument("--direct-model", default="MilaNLProc/xlm-emo-t", help="multilingual classifier for the direct engine")
+    args = parser.parse_args(argv)
+
+    expected = [label for _, label in TEXT_TEST_SET]
+    results = {engine: run_engine(engine, args.direct_model) for engine in ("translate", "direct")}
+
+    print(f"{'engine':<10} {'accuracy':>9} {'mean':>9} {'max':>9}")
+    for engine, (labels, seconds) in results.items():
+        accuracy = sum(a == b for a, b in zip(labels, expected)) / len(expected)
+        print(f"{engine:<10} {accuracy:>9.0%} {1000 * sum(seconds) / len(seconds):>7.1f}ms {1000 * max(seconds):>7.1f}ms")
+
+    translate_labels, direct_labels = results["translate"][0], results["direct"][0]
+    agreement = sum(a == b for a, b in zip(translate_labels, direct_labels)) / len(expected)
+    print(f"\nEngine agreement: {agreement:.0%}")
+    for (sentence, label), a, b in zip(TEXT_TEST_SET, translate_labels, direct_labels):
+        if a != b:
+            print(f"  {sentence}  expected={label} translate={a} direct={b}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,386 @@
+import os
+import time
+import queue
+import logging
+import itertools
+import threading
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import Future
+
+import numpy as np
+
+from audio_utils import MODEL_KEYS, SAMPLE_RATE, audio_cache_key, decode_audio_bytes
+from metrics import log_event
+
+class WorkerCrashed(RuntimeError):
+    """
+    Raised for requests that were running on a worker process that died or hung.
+    """
+
+def _worker_main(worker_id, cores, requests, responses, processor_kwargs, processor_factory=None):
+    """
+    Entry point of a worker process: pins itself to its cores, loads an
+    AudioProcessor (or `processor_factory`) with a matching thread budget and serves requests.
+    """
+    if cores and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    threads = max(1, len(cores))
+
+    from audio_utils import AudioProcessor
+    from metrics import configure_logging
+
+    # Spawned workers don't inherit the parent's logging setup
+    configure_logging()
+
+    kwargs = dict(processor_kwargs)
+    kwargs.setdefault("asr_threads", max(1, threads // 2))
+    kwargs.setdefault("torch_threads", max(1, threads - kwargs["asr_threads"]))
+    try:
+        processor = (processor_factory or AudioProcessor)(**kwargs)
+    except Exception as e:
+        responses.put(("load_failed", worker_id, f"{type(e).__name__}: {e}", None))
+        return
+    responses.put(("ready", worker_id, processor.readiness(), (processor.model_versions, processor.load_errors)))
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+
+        request_id, method, arrays, batch, args, kwargs = message
+        # The hang timer starts here, not while the request waits in the queue
+        responses.put(("started", worker_id, request_id, None))
+        blocks = []
+        waveforms = call_args = None
+        try:
+            waveforms = []
+            # Blocks are owned (and unlinked) by the parent; workers only attach
+            for name, shape, dtype in arrays:
+                shm = shared_memory.SharedMemory(name=name)
+                blocks.append(shm)
+                # Zero-copy view of the parent's waveform
+                waveforms.append(np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+
+            if batch:
+                call_args = (waveforms,) + tuple(args)
+            elif waveforms:
+                call_args = (waveforms[0],) + tuple(args)
+            else:
+                call_args = tuple(args)
+            result = getattr(processor, method)(*call_args, **kwargs)
+            responses.put(("ok", worker_id, request_id, result))
+        except Exception as e:
+            responses.put(("error", worker_id, request_id, f"{type(e).__name__}: {e}"))
+        finally:
+            # Views must be released before the blocks can be closed
+            waveforms = call_args = None
+            for shm in blocks:
+                shm.close()
+
+class _Worker:
+    def __init__(self, worker_id, cores):
+        self.worker_id = worker_id
+        self.cores = cores
+        self.process = None
+        self.requests = None
+        self.readiness = {name: False for name in MODEL_KEYS}
+        self.loaded = False
+        self.in_flight = {} # request_id -> (started_at or None while still queued, timeout)
+        # Consecutive starts that died before loading, and when the next one is due
+        self.failures = 0
+        self.restart_at = None
+        self.load_error = None
+        self.failed = False # gave up after max_restarts
+
+class ProcessPoolProcessor:
+    """
+    Runs AudioProcessor in `num_workers` separate processes, each pinned to its
+    own slice of cores with a matching intra-op thread count, so Python-side
+    preprocessing isn't serialized by one GIL.
+
+    Waveforms are decoded in the calling process and handed to workers through
+    multiprocessing.shared_memory rather than pickled. A monitor thread restarts
+    workers that die or hang; requests running on them fail with WorkerCrashed.
+    A request counts as hung after `request_timeout` plus `timeout_per_audio_second`
+    for every second of audio it carries, since a batch share of several long
+    clips legitimately takes much longer than one short clip. A worker that dies while loading its models is restarted
+    with exponential backoff, and given up on after `max_restarts` attempts in
+    a row; it then counts as loaded with errors (see load_errors).
+
+    Exposes the same interface as AudioProcessor (transcribe, predict_emotion,
+    predict_text_emotion, analyze, analyze_batch, readiness), so the app and
+    InferenceScheduler can use it in place of a single processor.
+    """
+
+    def __init__(self, num_workers=2, processor_kwargs=None, cache=None, health_interval=5.0, request_timeout=300.0,
+                 timeout_per_audio_second=2.0, max_restarts=5, max_restart_backoff=60.0, processor_factory=None):
+        self.num_workers = num_workers
+        self.processor_kwargs = processor_kwargs or {}
+        self.processor_factory = processor_factory
+        self.cache = cache
+        self.health_interval = health_interval
+        self.request_timeout = request_timeout
+        self.timeout_per_audio_second = timeout_per_audio_second
+        self.max_restarts = max_restarts
+        self.max_restart_backoff = max_restart_backoff
+        self.model_versions = None
+        self.restarts = 0
+        # Model name (or "worker-N" for a worker that never loaded) -> error
+        self.load_errors = {}
+
+        self._context = multiprocessing.get_context("spawn")
+        self._responses = self._context.Queue()
+        self._futures = {} # request_id -> (Future, [SharedMemory])
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._closed = False
+
+        if hasattr(os, "sched_getaffinity"):
+            cores = sorted(os.sched_getaffinity(0))
+        else:
+            cores = list(range(os.cpu_count() or 1))
+        slices = [cores[i::num_workers] for i in range(num_workers)]
+
+        self._workers = [_Worker(i, slices[i]) for i in range(num_workers)]
+        for worker in self._workers:
+            self._start(worker)
+
+        threading.Thread(target=self._collect, name="pool-responses", daemon=True).start()
+        threading.Thread(target=self._monitor, name="pool-monitor", daemon=True).start()
+
+    # --- AudioProcessor interface ---
+
+    def load_audio(self, audio):
+        return decode_audio_bytes(audio)
+
+    def transcribe(self, audio, latency_budget=None):
+        return self._call("transcribe", [self._waveform(audio)], kwargs={"latency_budget": latency_budget}).result()
+
+    def predict_emotion(self, audio, return_probs=False):
+        return self._call("predict_emotion", [self._waveform(audio)], kwargs={"return_probs": return_probs}).result()
+
+    def predict_text_emotion(self, text_ja):
+        return self._call("predict_text_emotion", [], args=(text_ja,)).result()
+
+    def analyze(self, audio, latency_budget=None):
+        cached = self.cached_result(audio, count_miss=True)
+        if cached is not None:
+            return cached
+        result = self._call("analyze", [self._waveform(audio)], kwargs={"latency_budget": latency_budget}).result()
+        self._store(audio, result)
+        return result
+
+    def analyze_batch(self, audios, stage_seconds=None):
+        """
+        Splits the batch across workers; each worker runs its share as one
+        AudioProcessor.analyze_batch() call.
+        """
+        results = [None] * len(audios)
+        todo = []
+        for i, audio in enumerate(audios):
+            results[i] = self.cached_result(audio, count_miss=True)
+            if results[i] is None:
+                todo.append(i)
+
+        shares = [todo[k::self.num_workers] for k in range(self.num_workers)]
+        calls = [
+            (share, self._call("analyze_batch", [self._waveform(audios[i]) for i in share], batch=True))
+            for share in shares if share
+        ]
+        for share, future in calls:
+            for i, result in zip(share, future.result()):
+                self._store(audios[i], result)
+                results[i] = result
+        return results
+
+    def cached_result(self, audio, count_miss=False):
+        # Misses are only counted by analyze()/analyze_batch(), not by the scheduler's pre-check
+        if self.cache is None or self.model_versions is None or isinstance(audio, str):
+            return None
+        return self.cache.get(audio_cache_key(audio, self.model_versions), count_miss=count_miss)
+
+    def is_ready(self, name):
+        return any(worker.readiness.get(name) for worker in self._workers)
+
+    def readiness(self):
+        return {name: self.is_ready(name) for name in MODEL_KEYS}
+
+    def wait_ready(self, names=MODEL_KEYS, timeout=None):
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not all(self.is_ready(name) for name in names):
+            if all(worker.loaded for worker in self._workers):
+                # Every worker finished loading; re-check in case "ready" arrived after the check above
+                return all(self.is_ready(name) for name in names)
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def close(self):
+        self._closed = True
+        for worker in self._workers:
+            worker.requests.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+            if worker.process.is_alive():
+                worker.process.terminate()
+
+    # --- internals ---
+
+    def _waveform(self, audio):
+        if isinstance(audio, np.ndarray):
+            return audio
+        return decode_audio_bytes(audio)
+
+    def _store(self, audio, result):
+        if self.cache is None or self.model_versions is None or isinstance(audio, str) or result.get("degraded"):
+            return
+        asr_policy = self.processor_kwargs.get("asr_policy")
+        if asr_policy is not None and not asr_policy.is_full_quality(result.get("asr_tier")):
+            return
+        self.cache.put(audio_cache_key(audio, self.model_versions), result)
+
+    def _start(self, worker):
+        worker.requests = self._context.Queue()
+        worker.readiness = {name: False for name in MODEL_KEYS}
+        worker.loaded = False
+        worker.process = self._context.Process(
+            target=_worker_main,
+            args=(worker.worker_id, worker.cores, worker.requests, self._responses, self.processor_kwargs, self.processor_factory),
+            name=f"audio-worker-{worker.worker_id}",
+            daemon=True
+        )
+        worker.process.start()
+
+    def _call(self, method, waveforms, batch=False, args=(), kwargs=None):
+        blocks = []
+        arrays = []
+        timeout = self.request_timeout + self.timeout_per_audio_second * sum(len(w) for w in waveforms) / SAMPLE_RATE
+        for waveform in waveforms:
+            waveform = np.ascontiguousarray(waveform, dtype=np.float32)
+            shm = shared_memory.SharedMemory(create=True, size=max(1, waveform.nbytes))
+            np.ndarray(waveform.shape, dtype=waveform.dtype, buffer=shm.buf)[:] = waveform
+            blocks.append(shm)
+            arrays.append((shm.name, waveform.shape, waveform.dtype.str))
+
+        future = Future()
+        request_id = next(self._ids)
+        with self._lock:
+            workers = [worker for worker in self._workers if not worker.failed]
+            if not workers:
+                for shm in blocks:
+                    shm.close()
+                    shm.unlink()
+                raise RuntimeError(f"No worker process could load the models: {self.load_errors}")
+            # Least-loaded live worker
+            worker = min(workers, key=lambda w: (not w.process.is_alive(), len(w.in_flight)))
+            worker.in_flight[request_id] = (None, timeout)
+            self._futures[request_id] = (future, blocks)
+        worker.requests.put((request_id, method, arrays, batch, args, kwargs or {}))
+        return future
+
+    def _finish(self, request_id, result=None, error=None):
+        entry = self._futures.pop(request_id, None)
+        if entry is None:
+            return
+        future, blocks = entry
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _collect(self):
+        while not self._closed:
+            try:
+                kind, worker_id, payload, extra = self._responses.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            worker = self._workers[worker_id]
+            with self._lock:
+                if kind == "ready":
+                    worker.readiness = payload
+                    worker.loaded = True
+                    worker.failures = 0
+                    self.model_versions, errors = extra
+                    self.load_errors.update(errors)
+                elif kind == "load_failed":
+                    worker.load_error = payload
+                elif kind == "started":
+                    if payload in worker.in_flight:
+                        worker.in_flight[payload] = (time.monotonic(), worker.in_flight[payload][1])
+                elif kind in ("ok", "error"):
+                    worker.in_flight.pop(payload, None)
+                    if kind == "ok":
+                        self._finish(payload, result=extra)
+                    else:
+                        self._finish(payload, error=RuntimeError(extra))
+
+    def _monitor(self):
+        while not self._closed:
+            time.sleep(self.health_interval)
+            now = time.monotonic()
+            for worker in self._workers:
+                if worker.failed:
+                    continue
+                with self._lock:
+                    running = [(started, timeout) for started, timeout in worker.in_flight.values() if started is not None]
+                hung = any(now - started > timeout for started, timeout in running)
+                if worker.process.is_alive() and not hung:
+                    continue
+                if self._closed:
+                    return
+
+                if worker.restart_at is not None:
+                    # Dead while loading; waiting out the backoff
+                    if now >= worker.restart_at:
+                        with self._lock:
+                            worker.restart_at = None
+                            self._restart(worker)
+                    continue
+
+                if not worker.loaded and not hung:
+                    worker.process.join(timeout=5)
+                    worker.failures += 1
+                    error = worker.load_error or f"exited with code {worker.process.exitcode} while loading"
+                    if worker.failures > self.max_restarts:
+                        log_event("pool.worker_failed", level=logging.ERROR, worker=worker.worker_id, attempts=worker.failures, error=error)
+                        with self._lock:
+                            worker.failed = True
+                            # Loaded with errors, so wait_ready() returns instead of waiting forever
+                            worker.loaded = True
+                            self.load_errors[f"worker-{worker.worker_id}"] = error
+                            self._fail_in_flight(worker)
+                        continue
+                    delay = min(self.health_interval * 2 ** (worker.failures - 1), self.max_restart_backoff)
+                    log_event("pool.worker_restart", level=logging.WARNING, worker=worker.worker_id, reason="load_failed",
+                              error=error, delay_seconds=delay)
+                    with self._lock:
+                        worker.restart_at = now + delay
+                        self._fail_in_flight(worker)
+                    continue
+
+                log_event("pool.worker_restart", level=logging.WARNING, worker=worker.worker_id, reason="hung" if hung else "crashed")
+                if worker.process.is_alive():
+                    worker.process.terminate()
+                worker.process.join(timeout=5)
+                with self._lock:
+                    self._restart(worker)
+
+    def _restart(self, worker):
+        # Restart before failing the requests, so callers retrying right away see the new worker
+        failed = list(worker.in_flight)
+        worker.in_flight.clear()
+        worker.load_error = None
+        self._start(worker)
+        self.restarts += 1
+        for request_id in failed:
+            self._finish(request_id, error=WorkerCrashed(f"Worker {worker.worker_id} stopped while handling the request"))
+
+    def _fail_in_flight(self, worker):
+        for request_id in list(worker.in_flight):
+            self._finish(request_id, error=WorkerCrashed(f"Worker {worker.worker_id} failed to load its models"))
+        worker.in_flight.clear()